@@ -0,0 +1,249 @@
+"""
+Keep the event id data on disk as a snapshot plus a journal of changes.
+
+The snapshot is the event id file the daemon always used: a pickled dict of
+plugin collection path to a dict of plugin name to (last event id, backlog)
+state. Rewriting it after every event gets expensive with many plugins and
+big backlogs, so the daemon appends the states that changed to a journal
+file next to it instead. The journal is replayed over the snapshot on load
+and folded back into the snapshot every so often.
+
+The snapshot is written to a temporary file and renamed over the previous
+one, so a crash never leaves a truncated event id file behind. A record cut
+short by a crash at the end of the journal is ignored on load.
+
+"""
+
+import os
+import time
+
+import six.moves.cPickle as pickle
+
+
+class CheckpointJournal(object):
+    """
+    Write the event id data of the engine to disk.
+    """
+
+    def __init__(self, path, syncEvents=500, syncInterval=1000, compactEvents=10000):
+        """
+        @param path: The path of the event id file.
+        @type path: I{str}
+        @param syncEvents: Number of journal records after which the journal
+            is flushed to the disk.
+        @type syncEvents: I{int}
+        @param syncInterval: Number of milliseconds after which written
+            records are flushed to the disk.
+        @type syncInterval: I{int}
+        @param compactEvents: Number of journal records after which they are
+            folded into the event id file.
+        @type compactEvents: I{int}
+        """
+        self.path = path
+        self.journalPath = path + ".journal"
+        self._syncEvents = max(1, syncEvents)
+        self._syncInterval = syncInterval / 1000.0
+        self._compactEvents = max(1, compactEvents)
+
+        # The states as they are on disk, to only journal the ones that
+        # changed.
+        self._written = {}
+        self._journal = None
+        self._records = 0
+        self._unsynced = 0
+        self._lastSync = time.time()
+        self._rewrite = False
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def load(self):
+        """
+        Read the event id file and replay the journal over it.
+
+        @return: The event id data.
+        @rtype: I{dict}
+
+        @raise pickle.UnpicklingError: If the event id file isn't a pickle,
+            it may then be an old style file holding a single event id.
+        """
+        with open(self.path, "rb") as fh:
+            try:
+                data = pickle.load(fh)
+            except pickle.UnpicklingError:
+                # Journaling over a file we can't read would lose the records,
+                # replace it on the next save.
+                self._rewrite = True
+                raise
+
+        records = 0
+        if os.path.exists(self.journalPath):
+            with open(self.journalPath, "r+b") as fh:
+                end = 0
+                while True:
+                    try:
+                        record = pickle.load(fh)
+                    except (EOFError, pickle.UnpicklingError, ValueError):
+                        # End of the journal, or the last record was cut
+                        # short by a crash.
+                        break
+                    self._replay(data, record)
+                    records += 1
+                    end = fh.tell()
+
+                # Drop what's left of a cut record so new records can be
+                # read after it.
+                fh.truncate(end)
+
+        self._written = _copyData(data)
+        self._records = records
+        return data
+
+    def _replay(self, data, record):
+        colPath, pluginName, lastEventId = record[:3]
+        states = data.setdefault(colPath, {})
+        if len(record) > 3:
+            backlog = record[3]
+        else:
+            backlog = _backlogOf(states.get(pluginName))
+        states[pluginName] = (lastEventId, backlog)
+
+    def save(self, data):
+        """
+        Journal the plugin states that changed since the last save.
+
+        @param data: The event id data of the engine.
+        @type data: I{dict}
+        """
+        if self._rewrite or not self.exists():
+            self.compact(data)
+            return
+
+        self._journalChanges(data)
+
+        # Hand the records over to the OS so they survive the daemon
+        # crashing, fsync them every so often so they survive the machine
+        # crashing.
+        self._journal.flush()
+        if self._unsynced and (
+            self._unsynced >= self._syncEvents
+            or time.time() - self._lastSync >= self._syncInterval
+        ):
+            self.sync()
+
+        if self._records >= self._compactEvents:
+            self.compact(data)
+
+    def _journalChanges(self, data):
+        if self._journal is None:
+            self._journal = open(self.journalPath, "ab")
+
+        for colPath, states in data.items():
+            written = self._written.setdefault(colPath, {})
+            for pluginName, state in states.items():
+                lastEventId, backlog = _splitState(state)
+                previous = written.get(pluginName)
+                if previous is not None and previous == (lastEventId, backlog):
+                    continue
+
+                if previous is not None and previous[1] == backlog:
+                    # Only the cursor moved, which is the common case.
+                    record = (colPath, pluginName, lastEventId)
+                else:
+                    record = (colPath, pluginName, lastEventId, backlog)
+                pickle.dump(record, self._journal, protocol=2)
+                written[pluginName] = (lastEventId, _copyBacklog(backlog))
+                self._records += 1
+                self._unsynced += 1
+
+    def sync(self):
+        if self._journal is not None:
+            self._journal.flush()
+            os.fsync(self._journal.fileno())
+        self._unsynced = 0
+        self._lastSync = time.time()
+
+    def compact(self, data):
+        """
+        Write all the event id data to the event id file and empty the
+        journal.
+
+        @param data: The event id data of the engine.
+        @type data: I{dict}
+        """
+        # The journal is replayed over the new file if we crash before it's
+        # emptied, and replaying overwrites states with the ones in it. Make
+        # its last records match the data so it can't rewind any plugin, or
+        # drop it if it doesn't go with the file being replaced.
+        if self.exists() and not self._rewrite:
+            self._journalChanges(data)
+            self.sync()
+        else:
+            self._emptyJournal()
+
+        tmpPath = self.path + ".tmp"
+        with open(tmpPath, "wb") as fh:
+            # Use protocol 2 so it can also be loaded in Python 2
+            pickle.dump(data, fh, protocol=2)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmpPath, self.path)
+        _syncDirectory(self.path)
+
+        self._emptyJournal()
+
+        self._written = _copyData(data)
+        self._rewrite = False
+        self._records = 0
+        self._unsynced = 0
+        self._lastSync = time.time()
+
+    def _emptyJournal(self):
+        self.close()
+        with open(self.journalPath, "wb") as fh:
+            os.fsync(fh.fileno())
+
+    def close(self):
+        if self._journal is not None:
+            self.sync()
+            self._journal.close()
+            self._journal = None
+
+
+def _splitState(state):
+    if isinstance(state, tuple):
+        return state[0], state[1]
+    return state, ()
+
+
+def _copyBacklog(backlog):
+    # Backlogs are saved as tuples of id ranges, older versions used dicts.
+    if isinstance(backlog, dict):
+        return dict(backlog)
+    return backlog
+
+
+def _backlogOf(state):
+    return _copyBacklog(_splitState(state)[1]) if state is not None else ()
+
+
+def _copyData(data):
+    copied = {}
+    for colPath, states in data.items():
+        copied[colPath] = {}
+        for pluginName, state in states.items():
+            lastEventId, backlog = _splitState(state)
+            copied[colPath][pluginName] = (lastEventId, _copyBacklog(backlog))
+    return copied
+
+
+def _syncDirectory(path):
+    # Make the rename itself durable. Not possible on Windows, where
+    # directories can't be opened.
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
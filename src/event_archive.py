@@ -0,0 +1,429 @@
+"""
+Keep a copy of the events the engine fetched on disk.
+
+Events are appended to segment files, a block of compressed events at a
+time. Each segment is named after the first event id it holds and holds the
+ids up to the first one of the next segment. A block for events that showed
+up late is appended to the segment their ids belong to, so the blocks of a
+segment may overlap but segments never do.
+
+Next to each segment, an index file lists the id range, offset and length
+of every block, so reading a range of ids only decompresses the blocks it
+overlaps, straight from the memory mapped segment. A block is only indexed
+once it is written, a block cut short by a crash at the end of a segment is
+dropped on load.
+
+Whole segments are removed, oldest first, once the archive gets bigger than
+its maximum size or they weren't written to for longer than its maximum age.
+This is checked when a segment is started and at least hourly while events
+are appended.
+
+Only the events fetched in full are kept. With server side filters or lean
+fetches on, events no live plugin wanted are fetched as stubs and left out,
+so the archive also keeps track of the id from which it holds every event,
+in a small state file next to the segments. Any stub, or the engine
+skipping ahead, moves that id past it.
+
+An archive can also be opened read only, by a replay running next to the
+daemon writing it. It then reads the indexes as they are when opened and
+never changes any file, a block not indexed yet is simply left out.
+
+"""
+
+import bisect
+import heapq
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+import six.moves.cPickle as pickle
+
+
+# First id, last id, offset and length of a block.
+_INDEX_ENTRY = struct.Struct("<qqQQ")
+
+
+class _Segment(object):
+    """
+    A segment file and the index of its blocks.
+    """
+
+    def __init__(self, path, firstId):
+        self.path = path
+        self.indexPath = path + ".idx"
+        self.firstId = firstId
+        self.blocks = []
+        self.size = 0
+        # The blocks by first id, their first ids, and the highest last id
+        # of the blocks up to each, to bisect both ends of a range as late
+        # blocks may overlap earlier ones. Replaced rather than changed so
+        # it can be read while blocks are appended.
+        self._sorted = ([], [], [])
+
+    def load(self, readOnly=False):
+        """
+        Read the index and drop whatever wasn't indexed at the end of the
+        segment.
+
+        @param readOnly: If True, the files are left as they are. A block
+            being written or an index entry cut short is ignored rather than
+            dropped.
+        @type readOnly: I{bool}
+        """
+        data = b""
+        try:
+            with open(self.indexPath, "rb") as fh:
+                data = fh.read()
+        except FileNotFoundError:
+            pass
+        usable = len(data) - len(data) % _INDEX_ENTRY.size
+        self.blocks = [
+            _INDEX_ENTRY.unpack_from(data, offset)
+            for offset in range(0, usable, _INDEX_ENTRY.size)
+        ]
+
+        if self.blocks:
+            self.size = self.blocks[-1][2] + self.blocks[-1][3]
+        if not readOnly:
+            if usable != len(data):
+                with open(self.indexPath, "r+b") as fh:
+                    fh.truncate(usable)
+            if os.path.exists(self.path) and os.path.getsize(self.path) != self.size:
+                with open(self.path, "r+b") as fh:
+                    fh.truncate(self.size)
+        self._sortBlocks()
+
+    def append(self, events):
+        """
+        @param events: The events of the block, in id order.
+        @type events: I{list}
+        """
+        data = zlib.compress(pickle.dumps(events, pickle.HIGHEST_PROTOCOL))
+        with open(self.path, "ab") as fh:
+            fh.write(data)
+        entry = (events[0]["id"], events[-1]["id"], self.size, len(data))
+        with open(self.indexPath, "ab") as fh:
+            fh.write(_INDEX_ENTRY.pack(*entry))
+        self.blocks.append(entry)
+        self.size += len(data)
+        self._sortBlocks()
+
+    def _sortBlocks(self):
+        sortedBlocks = sorted(self.blocks)
+        maxLastIds = []
+        for block in sortedBlocks:
+            maxLastIds.append(max(block[1], maxLastIds[-1] if maxLastIds else block[1]))
+        self._sorted = (sortedBlocks, [b[0] for b in sortedBlocks], maxLastIds)
+
+    def read(self, start, end):
+        """
+        Read the events of a range, a block at a time straight from the
+        memory mapped segment. Only blocks overlapping each other are
+        decompressed together.
+
+        @return: The events of the segment with ids from start to end
+            included, in id order.
+        @rtype: I{iterator}
+        """
+        blocks, firstIds, maxLastIds = self._sorted
+        # Blocks before low all end before start, the ones from high on all
+        # start after end.
+        low = bisect.bisect_left(maxLastIds, start)
+        high = bisect.bisect_right(firstIds, end)
+        if low >= high:
+            return
+
+        with open(self.path, "rb") as fh:
+            with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                # The next event of each block being read, smallest id first.
+                heap = []
+                index = low
+                lastId = None
+                while True:
+                    while index < high and (not heap or blocks[index][0] <= heap[0][0]):
+                        firstId, blockLastId, offset, length = blocks[index]
+                        if blockLastId >= start:
+                            block = pickle.loads(
+                                zlib.decompress(data[offset : offset + length])
+                            )
+                            self._push(heap, index, iter(block), start, end)
+                        index += 1
+                    if not heap:
+                        break
+
+                    eventId, blockIndex, event, events = heapq.heappop(heap)
+                    if eventId != lastId:
+                        lastId = eventId
+                        yield event
+                    self._push(heap, blockIndex, events, start, end)
+
+    def _push(self, heap, blockIndex, events, start, end):
+        for event in events:
+            if event["id"] > end:
+                return
+            if event["id"] >= start:
+                heapq.heappush(heap, (event["id"], blockIndex, event, events))
+                return
+
+    def getLastId(self):
+        if not self.blocks:
+            return None
+        return max(b[1] for b in self.blocks)
+
+    def getModificationTime(self):
+        return os.path.getmtime(self.path)
+
+    def remove(self):
+        for path in (self.path, self.indexPath):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class EventArchive(object):
+    """
+    An append only archive of Flow Production Tracking events.
+    """
+
+    # Number of seconds between two checks of the retention, besides the ones
+    # done when a new segment is started.
+    RETENTION_INTERVAL = 3600
+
+    def __init__(self, path, segmentSize=64, maxSize=1024, maxAge=30, readOnly=False):
+        """
+        @param path: The directory the segments are in, created if needed.
+        @type path: I{str}
+        @param segmentSize: Number of megabytes after which a new segment is
+            started.
+        @type segmentSize: I{int}
+        @param maxSize: Number of megabytes after which the oldest segments
+            are removed, 0 to keep them whatever their size.
+        @type maxSize: I{int}
+        @param maxAge: Number of days after which segments no longer written
+            to are removed, 0 to keep them whatever their age.
+        @type maxAge: I{int}
+        @param readOnly: If True, only read the archive as it is when opened,
+            without changing or removing any file, see L{append}.
+        @type readOnly: I{bool}
+
+        @raise ValueError: If the archive is opened read only and doesn't
+            exist.
+        """
+        self.path = path
+        self._segmentSize = segmentSize * 1024 * 1024
+        self._maxSize = maxSize * 1024 * 1024
+        self._maxAge = maxAge * 86400
+        self._readOnly = readOnly
+        self._lock = threading.Lock()
+
+        if not os.path.isdir(path):
+            if readOnly:
+                raise ValueError("No event archive in %s." % path)
+            os.makedirs(path)
+
+        self._segments = []
+        for name in os.listdir(path):
+            if name.endswith(".seg"):
+                segment = _Segment(os.path.join(path, name), int(name[: -len(".seg")]))
+                segment.load(readOnly)
+                self._segments.append(segment)
+        self._segments.sort(key=lambda s: s.firstId)
+        self._firstIds = [s.firstId for s in self._segments]
+
+        self._retentionTime = time.time()
+        if not readOnly:
+            self._applyRetention()
+
+        # The id from which every event is archived, and the highest id
+        # fetched, stubs included.
+        self._statePath = os.path.join(path, "state.json")
+        self._completeFrom = None
+        self._fetchedId = None
+        if os.path.exists(self._statePath):
+            with open(self._statePath) as fh:
+                state = json.load(fh)
+            self._completeFrom = state.get("complete_from")
+            self._fetchedId = state.get("fetched_id")
+
+        self._lastId = None
+        for segment in reversed(self._segments):
+            self._lastId = segment.getLastId()
+            if self._lastId is not None:
+                break
+
+    def getFirstId(self):
+        """
+        @return: The id the oldest segment of the archive starts at, I{None}
+            if it is empty.
+        @rtype: I{int}
+        """
+        with self._lock:
+            if not self._segments:
+                return None
+            return self._segments[0].firstId
+
+    def getLastId(self):
+        """
+        @return: The highest event id in the archive, I{None} if it is empty.
+        @rtype: I{int}
+        """
+        return self._lastId
+
+    def getCompleteFirstId(self):
+        """
+        @return: The id from which the archive holds every event up to its
+            last one, I{None} if that isn't known.
+        @rtype: I{int}
+        """
+        with self._lock:
+            if not self._segments or self._completeFrom is None:
+                return None
+            return max(self._segments[0].firstId, self._completeFrom)
+
+    def append(self, events, late=False, start=None):
+        """
+        Add fetched events to the archive.
+
+        Events fetched again, by a plugin catching up for example, are
+        skipped. Stubs standing for events that were filtered out when
+        fetching have nothing worth keeping and are skipped too.
+
+        @param events: The events, in id order.
+        @type events: I{list} of Flow Production Tracking event dictionaries.
+        @param late: True if the events are known to be missing from the
+            archive even though their ids are lower than its last one.
+        @type late: I{bool}
+        @param start: The id the events were fetched from, the first event's
+            id by default.
+        @type start: I{int}
+
+        @raise ValueError: If the archive was opened read only.
+        """
+        if self._readOnly:
+            raise ValueError("The event archive in %s is read only." % self.path)
+
+        with self._lock:
+            self._updateState(events, late, start)
+
+            if late:
+                events = [e for e in events if e["event_type"] is not None]
+                bySegment = {}
+                for event in events:
+                    index = bisect.bisect_right(self._firstIds, event["id"]) - 1
+                    if index < 0:
+                        # Older than the archive, its segment is gone.
+                        continue
+                    bySegment.setdefault(index, []).append(event)
+                for index, segmentEvents in sorted(bySegment.items()):
+                    self._segments[index].append(segmentEvents)
+                    if self._lastId is None or segmentEvents[-1]["id"] > self._lastId:
+                        self._lastId = segmentEvents[-1]["id"]
+                return
+
+            events = [
+                e
+                for e in events
+                if e["event_type"] is not None
+                and (self._lastId is None or e["id"] > self._lastId)
+            ]
+            if not events:
+                return
+
+            segment = self._segments[-1] if self._segments else None
+            if segment is None or segment.size >= self._segmentSize:
+                segment = _Segment(
+                    os.path.join(self.path, "%012d.seg" % events[0]["id"]),
+                    events[0]["id"],
+                )
+                self._segments.append(segment)
+                self._firstIds.append(segment.firstId)
+                self._applyRetention()
+
+            segment.append(events)
+            self._lastId = events[-1]["id"]
+
+            if time.time() - self._retentionTime > self.RETENTION_INTERVAL:
+                # A quiet site may not start a new segment for days.
+                self._applyRetention()
+
+    def _updateState(self, events, late, start):
+        """
+        Move the id from which every event is archived past the events
+        missing from the archive, and save it if it changed.
+        """
+        if not events:
+            return
+        if start is None:
+            start = events[0]["id"]
+
+        completeFrom, fetchedId = self._completeFrom, self._fetchedId
+        if not late:
+            if fetchedId is None or start > fetchedId + 1:
+                # Nothing is known of the events before start.
+                completeFrom = start
+            fetchedId = max(fetchedId or 0, events[-1]["id"])
+
+        for event in events:
+            # Stubs of events already fetched once don't change anything.
+            if event["event_type"] is None and (
+                late or self._fetchedId is None or event["id"] > self._fetchedId
+            ):
+                completeFrom = max(completeFrom or 0, event["id"] + 1)
+
+        if (completeFrom, fetchedId) != (self._completeFrom, self._fetchedId):
+            self._completeFrom, self._fetchedId = completeFrom, fetchedId
+            tmpPath = self._statePath + ".tmp"
+            with open(tmpPath, "w") as fh:
+                json.dump({"complete_from": completeFrom, "fetched_id": fetchedId}, fh)
+            os.replace(tmpPath, self._statePath)
+
+    def iterEvents(self, start=None, end=None):
+        """
+        Read back a range of events.
+
+        @param start: The first event id, from the start of the archive if
+            I{None}.
+        @type start: I{int}
+        @param end: The last event id, included, to the end of the archive if
+            I{None}.
+        @type end: I{int}
+
+        @return: The archived events in the range, in id order.
+        @rtype: I{iterator} of Flow Production Tracking event dictionaries.
+        """
+        if start is None:
+            start = 0
+        if end is None:
+            end = float("inf")
+
+        with self._lock:
+            index = max(0, bisect.bisect_right(self._firstIds, start) - 1)
+            segments = self._segments[index:]
+
+        for segment in segments:
+            if segment.firstId > end:
+                break
+            for event in segment.read(start, end):
+                yield event
+
+    def _applyRetention(self):
+        """
+        Remove the oldest segments beyond the maximum size or age, never the
+        one being written to.
+        """
+        now = time.time()
+        self._retentionTime = now
+        totalSize = sum(s.size for s in self._segments)
+        while len(self._segments) > 1:
+            segment = self._segments[0]
+            tooBig = self._maxSize and totalSize > self._maxSize
+            tooOld = self._maxAge and now - segment.getModificationTime() > self._maxAge
+            if not (tooBig or tooOld):
+                break
+            segment.remove()
+            totalSize -= segment.size
+            del self._segments[0]
+            del self._firstIds[0]
@@ -0,0 +1,154 @@
+"""
+The ids of events a plugin skipped because they weren't in the event log yet.
+
+Events can show up in the event log after events with higher ids, so a plugin
+keeps the ids it jumped over for a while in case they show up. A jump can be
+huge, after a bulk import for example, so ids are kept as ranges rather than
+one by one.
+
+"""
+
+import bisect
+
+
+class EventBacklog(object):
+    """
+    Sorted, non overlapping ranges of event ids, each with the time after
+    which they are given up on.
+    """
+
+    def __init__(self, state=None):
+        """
+        @param state: The value of L{getState}, or the dict of event id to
+            expiration time older versions saved.
+        @type state: I{tuple} or I{dict}
+        """
+        self._starts = []
+        self._ranges = []
+        self._earliest = None
+
+        if isinstance(state, dict):
+            for eventId in sorted(state):
+                expiration = state[eventId]
+                if (
+                    self._ranges
+                    and self._ranges[-1][1] == eventId - 1
+                    and self._ranges[-1][2] == expiration
+                ):
+                    start = self._ranges[-1][0]
+                    self._ranges[-1] = (start, eventId, expiration)
+                else:
+                    self._insert(eventId, eventId, expiration)
+            self._updateEarliest()
+        elif state:
+            for start, end, expiration in state:
+                self.add(start, end, expiration)
+
+    def _insert(self, start, end, expiration):
+        index = bisect.bisect_left(self._starts, start)
+        self._starts.insert(index, start)
+        self._ranges.insert(index, (start, end, expiration))
+
+    def _updateEarliest(self):
+        if self._ranges:
+            self._earliest = min(r[2] for r in self._ranges)
+        else:
+            self._earliest = None
+
+    def _find(self, eventId):
+        index = bisect.bisect_right(self._starts, eventId) - 1
+        if index >= 0 and self._ranges[index][1] >= eventId:
+            return index
+        return None
+
+    def add(self, start, end, expiration):
+        """
+        Add a range of event ids.
+
+        @param start: The first id of the range.
+        @type start: I{int}
+        @param end: The last id of the range, included.
+        @type end: I{int}
+        @param expiration: When to give up on the range.
+        @type expiration: L{datetime.datetime}
+        """
+        # Merge the ranges it overlaps, keeping the latest expiration.
+        index = bisect.bisect_right(self._starts, end)
+        while index > 0 and self._ranges[index - 1][1] >= start:
+            index -= 1
+            otherStart, otherEnd, otherExpiration = self._ranges[index]
+            del self._starts[index]
+            del self._ranges[index]
+            start = min(start, otherStart)
+            end = max(end, otherEnd)
+            expiration = max(expiration, otherExpiration)
+
+        self._insert(start, end, expiration)
+        if self._earliest is None or expiration < self._earliest:
+            self._earliest = expiration
+
+    def discard(self, eventId):
+        """
+        Remove an event id, if it's in the backlog.
+
+        @param eventId: The id to remove.
+        @type eventId: I{int}
+        """
+        index = self._find(eventId)
+        if index is None:
+            return
+
+        start, end, expiration = self._ranges[index]
+        del self._starts[index]
+        del self._ranges[index]
+        if start < eventId:
+            self._insert(start, eventId - 1, expiration)
+        if eventId < end:
+            self._insert(eventId + 1, end, expiration)
+        if not self._ranges:
+            self._earliest = None
+
+    def expire(self, now):
+        """
+        Remove the ranges whose expiration time is past.
+
+        @param now: The current time.
+        @type now: L{datetime.datetime}
+
+        @return: The (start, end) ranges removed.
+        @rtype: I{list} of I{tuple}
+        """
+        if self._earliest is None or now <= self._earliest:
+            return []
+
+        expired = [(r[0], r[1]) for r in self._ranges if r[2] < now]
+        self._ranges = [r for r in self._ranges if r[2] >= now]
+        self._starts = [r[0] for r in self._ranges]
+        self._updateEarliest()
+        return expired
+
+    def getRanges(self):
+        """
+        @return: The (start, end) ranges of ids, in order.
+        @rtype: I{list} of I{tuple}
+        """
+        return [(r[0], r[1]) for r in self._ranges]
+
+    def getState(self):
+        """
+        @return: The (start, end, expiration) ranges, to save and later pass
+            to the constructor.
+        @rtype: I{tuple}
+        """
+        return tuple(self._ranges)
+
+    def __contains__(self, eventId):
+        return self._find(eventId) is not None
+
+    def __len__(self):
+        return sum(r[1] - r[0] + 1 for r in self._ranges)
+
+    def __bool__(self):
+        return bool(self._ranges)
+
+    __nonzero__ = __bool__
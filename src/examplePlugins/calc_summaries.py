@@ -9,7 +9,6 @@
 
 from __future__ import division
 import os
-import shotgun_api3
 
 
 def registerCallbacks(reg):
@@ -21,7 +20,6 @@ def registerCallbacks(reg):
 
     # Grab authentication env vars for this plugin. Install these into the env
     # if they don't already exist.
-    server = os.environ["SG_SERVER"]
     script_name = os.environ["SGDAEMON_CALCSUMMARIES_NAME"]
     script_key = os.environ["SGDAEMON_CALCSUMMARIES_KEY"]
 
@@ -55,8 +53,9 @@ def registerCallbacks(reg):
         ],
     }
 
-    # Grab an sg connection for the validator.
-    sg = shotgun_api3.Shotgun(server, script_name=script_name, api_key=script_key)
+    # Grab an sg connection for the validator, the daemon shares it with our
+    # callback.
+    sg = reg.getShotgun(script_name, script_key)
 
     # Bail if our validator fails.
     if not is_valid(sg, reg.logger, args):
@@ -156,6 +156,322 @@ class Config(object):
 
         return self.service.get('fetch_interval')
 
+    @property
+    def min_fetch_interval(self) -> float:
+        """
+        Minimum number of seconds to wait between two requests for new
+        events. The wait shrinks toward this value while events keep coming
+        and grows back to fetch_interval while none do.
+
+        """
+
+        return self.service.get('min_fetch_interval', 0.5)
+
+    @property
+    def target_batch_time(self) -> float:
+        """
+        Number of seconds a batch of events should take to process. Batches
+        are sized from how long events took so far to stay around it. 0
+        always fetches max_event_batch_size events.
+
+        """
+
+        return self.service.get('target_batch_time', 10)
+
+    @property
+    def max_catch_up_batch_size(self) -> int:
+        """
+        Maximum number of events to fetch at once while far behind the event
+        log, when processing events is quick enough.
+
+        """
+
+        return self.service.get('max_catch_up_batch_size', 5000)
+
+    @property
+    def parallel_fetch_connections(self) -> int:
+        """
+        Number of windows of event ids fetched at once, each over its own
+        connection, while more than parallel_fetch_threshold events behind.
+        1 or less fetches one batch after the other.
+
+        """
+
+        return self.service.get('parallel_fetch_connections', 4)
+
+    @property
+    def parallel_fetch_threshold(self) -> int:
+        """
+        Number of events behind the last one of the event log after which
+        events are fetched over several connections at once.
+
+        """
+
+        return self.service.get('parallel_fetch_threshold', 20000)
+
+    @property
+    def prefetch_queue_size(self) -> int:
+        """
+        Number of event batches that may be fetched ahead of the batch
+        currently being dispatched. Fetching happens in a background thread so
+        network round trips overlap with callback run time. Set to 0 to fetch
+        and dispatch one batch after the other.
+
+        """
+
+        return self.service.get('prefetch_queue_size', 2)
+
+    @property
+    def dispatch_threads(self) -> int:
+        """
+        Number of threads used to dispatch events to plugins. Each plugin
+        processes its events in order, but different plugins run concurrently
+        so a slow plugin doesn't hold back the others. Set to 0 to run every
+        plugin one after the other in the main loop.
+
+        """
+
+        return self.service.get('dispatch_threads', 0)
+
+    @property
+    def plugin_queue_size(self) -> int:
+        """
+        Maximum number of events waiting to be processed by a single plugin
+        when dispatching on threads, and maximum number of events a plugin's
+        partitioned callbacks may have in flight. Fetching pauses when a
+        plugin falls this far behind.
+
+        """
+
+        return self.service.get('plugin_queue_size', 1000)
+
+    @property
+    def async_engine(self) -> bool:
+        """
+        Run the event processing loop on an asyncio event loop. Plugins
+        process their events concurrently, callbacks defined with `async def`
+        are awaited on the loop and other callbacks run on a pool of
+        dispatch_threads threads. The Shotgun instance handed to `async def`
+        callbacks has awaitable methods running the calls on that pool.
+
+        """
+
+        return self.service.get('async_engine', False)
+
+    @property
+    def callback_concurrency_per_key(self) -> int:
+        """
+        Maximum number of callbacks using the same script key that the
+        asyncio engine runs at once, or of Shotgun calls for `async def`
+        callbacks.
+
+        """
+
+        return self.service.get('callback_concurrency_per_key', 8)
+
+    @property
+    def catch_up_threshold(self) -> int:
+        """
+        Number of events a plugin may be behind the most up to date plugin
+        before it catches up on its own, with events fetched for it only, so
+        the other plugins keep getting new events as they come. Set to 0 to
+        always fetch from the plugin furthest behind.
+
+        """
+
+        return self.service.get('catch_up_threshold', 5000)
+
+    @property
+    def server_side_filters(self) -> bool:
+        """
+        Only fetch the fields of the events matching the matchEvents of at
+        least one active callback. The other events are listed by id so the
+        event ids of the plugins keep moving, but their data is never
+        downloaded. Has no effect while a callback accepts every event.
+
+        """
+
+        return self.service.get('server_side_filters', True)
+
+    @property
+    def lean_event_fetch(self) -> bool:
+        """
+        List each batch of events with only the fields needed to route them,
+        then fetch in full the events an active callback will process, with
+        a single query. Takes over server_side_filters when on.
+
+        """
+
+        return self.service.get('lean_event_fetch', False)
+
+    @property
+    def schema_cache_ttl(self) -> int:
+        """
+        Number of seconds schema reads made by callbacks are cached for. The
+        cache is shared by all plugins and dropped whenever a field or status
+        is created, changed or deleted. Set to 0 to disable caching.
+
+        """
+
+        return self.service.get('schema_cache_ttl', 300)
+
+    @property
+    def checkpoint_sync_events(self) -> int:
+        """
+        Number of plugin state changes appended to the event id journal after
+        which it is flushed to the disk with fsync.
+
+        """
+
+        return self.service.get('checkpoint_sync_events', 500)
+
+    @property
+    def checkpoint_sync_interval(self) -> int:
+        """
+        Number of milliseconds after which plugin state changes appended to
+        the event id journal are flushed to the disk with fsync.
+
+        """
+
+        return self.service.get('checkpoint_sync_interval', 1000)
+
+    @property
+    def checkpoint_compact_events(self) -> int:
+        """
+        Number of plugin state changes appended to the event id journal after
+        which they are folded back into the event id file.
+
+        """
+
+        return self.service.get('checkpoint_compact_events', 10000)
+
+    @property
+    def api_rate_limit(self) -> float:
+        """
+        Number of calls per second the daemon makes at most with each script
+        key, 0 to not cap it. Off by default, how many calls run at once
+        already backs off when the server is overloaded or slows down.
+
+        """
+
+        return self.service.get('api_rate_limit', 0)
+
+    @property
+    def api_rate_burst(self) -> int:
+        """
+        Number of calls which may be made at once with a script key after it
+        went unused for a while, when api_rate_limit is set.
+
+        """
+
+        return self.service.get('api_rate_burst', 50)
+
+    @property
+    def api_max_concurrency(self) -> int:
+        """
+        Maximum number of calls running at once with each script key. How many
+        may actually run is adjusted as calls complete, backing off when the
+        server is overloaded or slows down. Set to 0 to not limit calls at all.
+
+        """
+
+        return self.service.get('api_max_concurrency', 16)
+
+    @property
+    def api_retry_attempts(self) -> int:
+        """
+        Number of times a read made by a callback is tried again when it
+        fails because of the network or an overloaded server, waiting a bit
+        longer every time. Writes are never tried again.
+
+        """
+
+        return self.service.get('api_retry_attempts', 3)
+
+    @property
+    def circuit_breaker_failures(self) -> int:
+        """
+        Number of calls in a row failing to reach the server after which all
+        calls are held back, until a single call probing the server gets
+        through. Probes are spaced out up to conn_retry_sleep seconds. Set to
+        0 to never hold calls back.
+
+        """
+
+        return self.service.get('circuit_breaker_failures', 5)
+
+    @property
+    def write_batch_size(self) -> int:
+        """
+        Number of writes held back by callbacks registered with batchWrites
+        after which they are sent, and the number of writes per batch call.
+
+        """
+
+        return self.service.get('write_batch_size', 100)
+
+    @property
+    def write_batch_interval(self) -> int:
+        """
+        Number of milliseconds after which the writes held back by a callback
+        are sent on its next write. They are also sent after each batch of
+        events.
+
+        """
+
+        return self.service.get('write_batch_interval', 1000)
+
+    @property
+    def event_archive_segment_size(self) -> int:
+        """
+        Number of megabytes after which the event archive starts a new
+        segment file.
+
+        """
+
+        return self.service.get('event_archive_segment_size', 64)
+
+    @property
+    def event_archive_max_size(self) -> int:
+        """
+        Number of megabytes after which the oldest segments of the event
+        archive are removed. 0 keeps them whatever their size.
+
+        """
+
+        return self.service.get('event_archive_max_size', 1024)
+
+    @property
+    def event_archive_max_age(self) -> int:
+        """
+        Number of days after which segments of the event archive no longer
+        written to are removed. 0 keeps them whatever their age.
+
+        """
+
+        return self.service.get('event_archive_max_age', 30)
+
+    @property
+    def process_plugins(self) -> list:
+        """
+        Names of the plugins whose callbacks run in a pool of worker processes
+        rather than in the daemon's interpreter. Useful for CPU heavy plugins,
+        and a crashing worker won't take the daemon down with it.
+
+        """
+
+        return self.plugins.get('process_plugins', [])
+
+    @property
+    def process_pool_size(self) -> Optional[int]:
+        """
+        Number of worker processes running the process_plugins callbacks.
+        Defaults to the number of CPUs on the machine.
+
+        """
+
+        return self.plugins.get('process_pool_size')
+
     @property
     def use_session_uuid(self) -> bool:
         """
@@ -396,6 +712,22 @@ class Config(object):
         else:
             return None
 
+    def getEventArchiveDir(self) -> Optional[str]:
+        """
+        The directory where the daemon keeps a copy of the events it fetched,
+        to read them back without asking Flow Production Tracking again.
+        Leave empty to not keep any.
+
+        Can include {service_name} for string substitution
+
+        """
+
+        config_value = self.service.get('event_archive_dir')
+        if not config_value:
+            return None
+        dirname = config_value.format(service_name=self.service_name)
+        return str(self.log_dir / dirname).replace('\\', '/')
+
 
 def read_json(file_path) -> dict:
 
@@ -0,0 +1,197 @@
+"""
+Run plugin callbacks in worker processes instead of the daemon's interpreter.
+
+The daemon still loads every plugin itself to know which events its callbacks
+want. For plugins configured to run in the process pool, the callback call is
+sent to a worker process along with the event. The worker loads the plugin on
+its own, keeps its own Shotgun connections and sends back whether the callback
+succeeded so the daemon can keep its event id bookkeeping.
+
+"""
+
+import asyncio
+import inspect
+import logging
+import os
+import pprint
+import sys
+import traceback
+import warnings
+
+with warnings.catch_warnings():
+    warnings.filterwarnings("ignore", category=DeprecationWarning)
+    import imp
+
+import shotgun_api3 as sg
+
+import shotgun_proxy
+
+# Worker process state. Plugins are keyed by path and reloaded when their
+# mtime changes, connections are keyed by the credentials they use.
+_plugins = {}
+_connections = {}
+
+
+class PluginHostError(Exception):
+    """
+    Raised in the daemon when a callback failed in a worker process.
+    """
+
+    def __init__(self, trace, localVars):
+        super(PluginHostError, self).__init__(trace)
+        self.trace = trace
+        self.localVars = localVars
+
+
+class _RecordingRegistrar(object):
+    """
+    Stand-in for the daemon's Registrar that records the callbacks a plugin
+    registers.
+    """
+
+    def __init__(self, pluginName, url, proxy):
+        self.logger = logging.getLogger("plugin." + pluginName)
+        self.callbacks = []
+        self._url = url
+        self._proxy = proxy
+
+    def getLogger(self):
+        return self.logger
+
+    def getShotgun(self, sgScriptName, sgScriptKey):
+        return _getConnection(self._url, sgScriptName, sgScriptKey, self._proxy)
+
+    def setEmails(self, *emails):
+        pass
+
+    def registerCallback(
+        self,
+        sgScriptName,
+        sgScriptKey,
+        callback,
+        matchEvents=None,
+        args=None,
+        stopOnError=True,
+        **kwargs
+    ):
+        self.callbacks.append((sgScriptName, sgScriptKey, callback, args))
+
+
+class _RecordHandler(logging.Handler):
+    """
+    Keep the log records of a callback so they can be sent back to the daemon.
+    """
+
+    def __init__(self):
+        super(_RecordHandler, self).__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append((record.levelno, self.format(record)))
+
+
+def _loadPlugin(path, url, proxy):
+    mtime = os.path.getmtime(path)
+    cached = _plugins.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    pluginName = os.path.splitext(os.path.basename(path))[0]
+    plugin = imp.load_source(pluginName, path)
+    registrar = _RecordingRegistrar(pluginName, url, proxy)
+    plugin.registerCallbacks(registrar)
+
+    _plugins[path] = (mtime, registrar.callbacks)
+    return registrar.callbacks
+
+
+def _getConnection(url, scriptName, scriptKey, proxy):
+    key = (url, scriptName, scriptKey, proxy)
+    if key not in _connections:
+        _connections[key] = sg.Shotgun(url, scriptName, scriptKey, http_proxy=proxy)
+    return _connections[key]
+
+
+async def _awaitCallback(callback, shotgun, logger, event, args):
+    # The worker's connection can't be shared between threads, the calls
+    # run one at a time.
+    shotgun = shotgun_proxy.AsyncShotgunProxy(shotgun, asyncio.Semaphore(1))
+    await callback(shotgun, logger, event, args)
+
+
+def runCallback(
+    path, index, callbackName, loggerName, logLevel, event, url, proxy, useSessionUuid
+):
+    """
+    Run a plugin callback on an event. This is called in a worker process.
+
+    @param path: The path of the plugin file.
+    @type path: I{str}
+    @param index: The position of the callback in the order the plugin
+        registers its callbacks.
+    @type index: I{int}
+    @param callbackName: The name of the callback, used to make sure the
+        worker found the same callback as the daemon.
+    @type callbackName: I{str}
+    @param event: The Flow Production Tracking event to process.
+    @type event: I{dict}
+
+    @return: A success flag, the traceback and local variables of the plugin
+        frame on failure, and the (level, message) log records of the callback.
+    @rtype: I{tuple}
+    """
+    logger = logging.getLogger(loggerName)
+    logger.setLevel(logLevel)
+    logger.propagate = False
+    handler = _RecordHandler()
+    logger.addHandler(handler)
+
+    try:
+        try:
+            callbacks = _loadPlugin(path, url, proxy)
+            scriptName, scriptKey, callback, args = callbacks[index]
+            name = getattr(callback, "__name__", callback.__class__.__name__)
+            if not callbackName.startswith(name):
+                raise ValueError(
+                    "Callback %d of the plugin is %s, expected %s."
+                    % (index, name, callbackName)
+                )
+            shotgun = _getConnection(url, scriptName, scriptKey, proxy)
+        except Exception:
+            msg = "Could not load the plugin at %s in worker process %d.\n\n%s"
+            return False, (msg % (path, os.getpid(), traceback.format_exc()), ""), []
+
+        if useSessionUuid:
+            shotgun.set_session_uuid(event["session_uuid"])
+
+        try:
+            if inspect.iscoroutinefunction(callback) or inspect.iscoroutinefunction(
+                getattr(callback, "__call__", None)
+            ):
+                asyncio.run(_awaitCallback(callback, shotgun, logger, event, args))
+            else:
+                result = callback(shotgun, logger, event, args)
+                if inspect.iscoroutine(result):
+                    asyncio.run(result)
+        except Exception:
+            # Get the local variables of the frame of our plugin, skipping the
+            # asyncio machinery running coroutine callbacks.
+            tb = sys.exc_info()[2]
+            stack = []
+            while tb:
+                stack.append(tb.tb_frame)
+                tb = tb.tb_next
+
+            localVars = ""
+            for frame in stack[1:]:
+                if frame.f_code is _awaitCallback.__code__:
+                    continue
+                if not frame.f_globals.get("__name__", "").startswith("asyncio"):
+                    localVars = pprint.pformat(frame.f_locals)
+                    break
+
+            return False, (traceback.format_exc(), localVars), handler.records
+
+        return True, None, handler.records
+    finally:
+        logger.removeHandler(handler)
@@ -22,8 +22,9 @@ def registerCallbacks(reg):
     }
     
     # Register the event to the daemon
+    # Send the updates of all the team members in one batch call
     reg.registerCallback(script_name, script_key, project_wrap_cleanup,
-                         eventsFilter, None)
+                         eventsFilter, None, batchWrites=True)
     reg.logger.setLevel(logging.INFO)
 
 
@@ -24,7 +24,8 @@ def registerCallbacks(reg):
 
     # Register the event to the daemon
     reg.registerCallback(script_name, script_key,
-                         version_task_status_sync, event_filter, None)
+                         version_task_status_sync, event_filter, None,
+                         batchWrites=True)
 
 
 def version_task_status_sync(sg, logger, event, args):
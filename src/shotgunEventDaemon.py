@@ -35,17 +35,28 @@ with warnings.catch_warnings():
     warnings.filterwarnings("ignore", category=DeprecationWarning)
     import imp
 
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import contextlib
 import datetime
+import functools
+import inspect
 import logging
 import logging.handlers
+import multiprocessing
 import os
 import pprint
+import signal
 import socket
 import sys
+import threading
 import time
 import traceback
 from pathlib import Path
 from six.moves import configparser
+from six.moves import queue
 import six.moves.cPickle as pickle
 
 if sys.platform == "win32":
@@ -58,7 +69,12 @@ import daemonizer
 import shotgun_api3 as sg
 from shotgun_api3.lib.sgtimezone import SgTimezone
 
+import checkpoint_journal
+import event_archive
+import event_backlog
 import handler_config
+import plugin_host
+import shotgun_proxy
 
 # We need to run this on import so we can use the service name as a class
 # attribute for the WindowsService
@@ -255,6 +271,10 @@ class Engine(object):
     The engine holds the main loop of event processing.
     """
 
+    # Number of seconds between two checks of the id of the last event while
+    # behind.
+    HEAD_CHECK_INTERVAL = 60
+
     def __init__(self, configPath):
         """ """
         self._continue = True
@@ -267,17 +287,94 @@ class Engine(object):
         self._pluginCollections = [
             PluginCollection(self, s) for s in self.config.getPluginPaths()
         ]
-        self._sg = sg.Shotgun(
-            self.config.getShotgunURL(),
-            self.config.getEngineScriptName(),
-            self.config.getEngineScriptKey(),
-            http_proxy=self.config.getEngineProxyServer(),
+        self._schemaCache = None
+        if self.config.schema_cache_ttl:
+            self._schemaCache = shotgun_proxy.SchemaCache(self.config.schema_cache_ttl)
+        self._connections = shotgun_proxy.ConnectionPool(
+            self._connect,
+            self._schemaCache,
+            self.config.api_rate_limit,
+            self.config.api_rate_burst,
+            self.config.api_max_concurrency or None,
+            self.config.api_retry_attempts,
+            self.config.circuit_breaker_failures,
+            self.config.conn_retry_sleep,
+            logging.getLogger("engine"),
+        )
+        self._sg = self.getShotgun(
+            self.config.getEngineScriptName(), self.config.getEngineScriptKey()
         )
         self._max_conn_retries = self.config.max_conn_retries
         self._conn_retry_sleep = self.config.conn_retry_sleep
         self._fetch_interval = self.config.fetch_interval
+        self._pollInterval = _PollInterval(
+            self.config.min_fetch_interval, self._fetch_interval
+        )
+        self._wakeUp = threading.Event()
+        self._batchSize = _BatchSize(
+            self.config.getMaxEventBatchSize(),
+            self.config.max_catch_up_batch_size,
+            self.config.target_batch_time,
+        )
+        self._catchUpBatchSize = _BatchSize(
+            self.config.getMaxEventBatchSize(),
+            self.config.max_catch_up_batch_size,
+            self.config.target_batch_time,
+        )
+        self._rangeFetcher = _RangeFetcher(self, self.config.parallel_fetch_connections)
+        self._catchUpRangeFetcher = _RangeFetcher(
+            self, self.config.parallel_fetch_connections
+        )
+        self._headEventId = None
+        self._headCheckTime = None
+        self._headLock = threading.Lock()
         self._use_session_uuid = self.config.use_session_uuid
+        self._eventFilter = None
+        self._entityFieldRoutes = None
+        self._leanRoutes = None
+        self._catchingUp = set()
+        self._checkpoint = self._openCheckpoint()
+        self._archive = self._openArchive()
+        self._prefetcher = None
+        self._dispatcher = None
+        self._pluginHost = None
+        if self.config.process_plugins:
+            self._pluginHost = PluginHost(self, self.config.process_pool_size)
+
+        self._setUpLoggers()
+
+        super(Engine, self).__init__()
+
+    def _openCheckpoint(self):
+        """
+        @return: The journal of the event id file, I{None} if there is none.
+        @rtype: L{checkpoint_journal.CheckpointJournal}
+        """
+        if not self.config.getEventIdFile():
+            return None
+        return checkpoint_journal.CheckpointJournal(
+            self.config.getEventIdFile(),
+            self.config.checkpoint_sync_events,
+            self.config.checkpoint_sync_interval,
+            self.config.checkpoint_compact_events,
+        )
+
+    def _openArchive(self):
+        """
+        @return: The archive fetched events are kept in, I{None} if there is
+            none.
+        @rtype: L{event_archive.EventArchive}
+        """
+        if not self.config.getEventArchiveDir():
+            return None
+        return event_archive.EventArchive(
+            self.config.getEventArchiveDir(),
+            self.config.event_archive_segment_size,
+            self.config.event_archive_max_size,
+            self.config.event_archive_max_age,
+        )
 
+    def _setUpLoggers(self):
         # Setup the loggers for the main engine
         if self.config.getLogMode() == 0:
             # Set the root logger for file output.
@@ -307,7 +404,68 @@ class Engine(object):
         else:
             self.timing_logger = None
 
-        super(Engine, self).__init__()
+    def _connect(self, url, scriptName, scriptKey, proxy):
+        global sg
+        return sg.Shotgun(url, scriptName, scriptKey, http_proxy=proxy)
+
+    def getShotgun(self, scriptName, scriptKey):
+        """
+        Get a connection to the Shotgun server from the engine's pool.
+
+        Connections using the same credentials are shared, and kept open
+        across plugin reloads.
+
+        @param scriptName: The name of the script to connect as.
+        @type scriptName: I{str}
+        @param scriptKey: The key of the script.
+        @type scriptKey: I{str}
+
+        @return: A connection which may be used from any thread.
+        @rtype: L{shotgun_proxy.ShotgunProxy}
+        """
+        return self._connections.getShotgun(
+            self.config.getShotgunURL(),
+            scriptName,
+            scriptKey,
+            self.config.getEngineProxyServer(),
+        )
+
+    def getBatchingShotgun(self, scriptName, scriptKey, logger):
+        """
+        Get a connection from the engine's pool which holds back its writes
+        and sends them in batches, see
+        L{shotgun_proxy.BatchingShotgunProxy}.
+
+        @param scriptName: The name of the script to connect as.
+        @type scriptName: I{str}
+        @param scriptKey: The key of the script.
+        @type scriptKey: I{str}
+        @param logger: Where to log writes that could not be sent.
+        @type logger: L{logging.Logger}
+
+        @rtype: L{shotgun_proxy.BatchingShotgunProxy}
+        """
+        return self._connections.getBatchingShotgun(
+            self.config.getShotgunURL(),
+            scriptName,
+            scriptKey,
+            self.config.getEngineProxyServer(),
+            self.config.write_batch_size,
+            self.config.write_batch_interval,
+            logger,
+        )
+
+    def setLogFileOnLogger(self, logger, name):
+        """
+        Give a logger a file of its own when the log mode asks for one.
+
+        @param logger: The logger to configure.
+        @type logger: L{logging.Logger}
+        @param name: The name of the log file, see L{Config.getLogFile}.
+        @type name: I{str}
+        """
+        if self.config.getLogMode() == 1:
+            _setFilePathOnLogger(logger, self.config.getLogFile(name))
 
     def setEmailsOnLogger(self, logger, emails):
         # Configure the logger for email output
@@ -362,6 +520,8 @@ class Engine(object):
         try:
             for collection in self._pluginCollections:
                 collection.load()
+            self._updateEventFilter()
+            self._updateEntityFields()
 
             self._loadEventIdData()
 
@@ -383,11 +543,10 @@ class Engine(object):
         """
         eventIdFile = self.config.getEventIdFile()
 
-        if eventIdFile and os.path.exists(eventIdFile):
+        if self._checkpoint is not None and self._checkpoint.exists():
             try:
-                fh = open(eventIdFile, "rb")
                 try:
-                    self._eventIdData = pickle.load(fh)
+                    self._eventIdData = self._checkpoint.load()
 
                     # Provide event id info to the plugin collections. Once
                     # they've figured out what to do with it, ask them for their
@@ -407,15 +566,7 @@ class Engine(object):
                     # moved. If there's no match, use the latest event id
                     # in Shotgun.
                     if noStateCollections:
-                        maxPluginStates = {}
-                        for collection in self._eventIdData.values():
-                            for pluginName, pluginState in collection.items():
-                                if pluginName in maxPluginStates.keys():
-                                    if pluginState[0] > maxPluginStates[pluginName][0]:
-                                        maxPluginStates[pluginName] = pluginState
-                                else:
-                                    maxPluginStates[pluginName] = pluginState
-
+                        maxPluginStates = self._getMaxPluginStates()
                         lastEventId = self._getLastEventIdFromDatabase()
                         for collection in noStateCollections:
                             state = collection.getState()
@@ -427,12 +578,10 @@ class Engine(object):
                             collection.setState(state)
 
                 except pickle.UnpicklingError:
-                    fh.close()
-
                     # Backwards compatibility:
                     # Reopen the file to try to read an old-style int
-                    fh = open(eventIdFile, "rb")
-                    line = fh.readline().strip()
+                    with open(eventIdFile, "rb") as fh:
+                        line = fh.readline().strip()
                     if line.isdigit():
                         # The _loadEventIdData got an old-style id file containing a single
                         # int which is the last id properly processed.
@@ -442,7 +591,6 @@ class Engine(object):
                         )
                         for collection in self._pluginCollections:
                             collection.setState(lastEventId)
-                fh.close()
             except OSError as err:
                 raise EventDaemonError(
                     "Could not load event id from file.\n\n%s" % traceback.format_exc()
@@ -457,6 +605,50 @@ class Engine(object):
 
             self._saveEventIdData()
 
+    def _getMaxPluginStates(self):
+        """
+        Find the most recent state saved for every plugin name, whatever
+        collection it was saved under.
+
+        @return: The state of every plugin name in the event id data.
+        @rtype: I{dict}
+        """
+        maxPluginStates = {}
+        for collection in self._eventIdData.values():
+            for pluginName, pluginState in collection.items():
+                if pluginName in maxPluginStates.keys():
+                    if pluginState[0] > maxPluginStates[pluginName][0]:
+                        maxPluginStates[pluginName] = pluginState
+                else:
+                    maxPluginStates[pluginName] = pluginState
+        return maxPluginStates
+
+    def _seedPluginStates(self, plugins):
+        """
+        Set up the state of plugins discovered after startup.
+
+        The state saved for the plugin is used if there is one, then the most
+        recent state saved for a plugin of the same name in another
+        collection, and failing that the latest event in Shotgun.
+
+        @param plugins: The new plugins and the collection they are in.
+        @type plugins: I{list} of (L{PluginCollection}, L{Plugin}) tuples.
+        """
+        maxPluginStates = None
+        lastEventId = None
+        for collection, plugin in plugins:
+            state = self._eventIdData.get(collection.path, {}).get(plugin.getName())
+            if not state or state[0] is None:
+                if maxPluginStates is None:
+                    maxPluginStates = self._getMaxPluginStates()
+                state = maxPluginStates.get(plugin.getName())
+            if not state or state[0] is None:
+                if lastEventId is None:
+                    lastEventId = self._getLastEventIdFromDatabase()
+                state = lastEventId
+
+            plugin.setState(state)
+
     def _getLastEventIdFromDatabase(self):
 
         conn_attempts = 0
@@ -501,111 +693,810 @@ class Engine(object):
         - Each time through the loop, if the pidFile is gone, stop.
         """
         self.log.debug("Starting the event processing loop.")
+        if self.config.prefetch_queue_size > 0:
+            self._prefetcher = EventPrefetcher(self, self.config.prefetch_queue_size)
+            self._prefetcher.start()
+        if self.config.dispatch_threads > 0:
+            self._dispatcher = PluginDispatcher(
+                self, self.config.dispatch_threads, self.config.plugin_queue_size
+            )
+
         while self._continue:
+            # Process events that were missing when their successors were
+            # processed and have shown up since.
+            for event in self._getBacklogEvents():
+                for collection in self._pluginCollections:
+                    collection.process(event, backlogOnly=True)
+                if self._dispatcher is None:
+                    self._saveEventIdData()
+
             # Process events
             events = self._getNewEvents()
+            self._batchSize.dispatched(events)
             for event in events:
                 for collection in self._pluginCollections:
                     collection.process(event)
-                self._saveEventIdData()
+                if self._dispatcher is None:
+                    self._saveEventIdData()
+            self._recordProgress()
+
+            # Then a batch for the plugins far behind.
+            catchUpEvents = self._getCatchUpEvents()
+            self._catchUpBatchSize.dispatched(catchUpEvents)
+            for event in catchUpEvents:
+                for collection in self._pluginCollections:
+                    collection.process(event, catchingUp=True)
+                if self._dispatcher is None:
+                    self._saveEventIdData()
+
+            # Plugins make progress on their own threads, and events whose
+            # writes were held back are only done once the writes are sent.
+            # Checkpoint whatever has been processed so far.
+            self._flushWrites()
+            self._saveEventIdData()
+            self._recordProgress()
 
             # if we're lagging behind Shotgun, we received a full batch of events
-            # skip the sleep() call in this case
-            if len(events) < self.config.getMaxEventBatchSize():
-                time.sleep(self._fetch_interval)
+            # skip the sleep() call in this case. When prefetching, the
+            # prefetcher thread takes care of waiting between fetches.
+            if (
+                self._prefetcher is None
+                and not self._batchSize.isBehind()
+                and not self._catchUpBatchSize.isBehind()
+            ):
+                self._sleep(len(events) + len(catchUpEvents))
+
+            if self._dispatcher is not None:
+                # Plugins must not be reloaded or have their state changed
+                # while they are processing an event.
+                with self._dispatcher.paused():
+                    self._flushWrites()
+                    self._saveEventIdData()
+                    self._reloadPlugins()
+            else:
+                self._reloadPlugins()
 
-            # Reload plugins
-            for collection in self._pluginCollections:
-                collection.load()
+        if self._prefetcher is not None:
+            self._prefetcher.stop()
+            self._prefetcher = None
+        if self._dispatcher is not None:
+            self._dispatcher.shutdown()
+            self._dispatcher = None
 
-            # Make sure that newly loaded events have proper state.
-            self._loadEventIdData()
+        self._finishProcessing()
 
         self.log.debug("Shuting down event processing loop.")
 
+    def _finishProcessing(self):
+        """
+        Stop the plugins' lanes and worker processes and save how far every
+        plugin got.
+        """
+        self._rangeFetcher.shutdown()
+        self._catchUpRangeFetcher.shutdown()
+        for collection in self._pluginCollections:
+            for plugin in collection:
+                plugin.drain(cancel=True)
+        self._saveEventIdData(compact=True)
+
+        if self._pluginHost is not None:
+            self._pluginHost.shutdown()
+
     def stop(self):
         self._continue = False
+        self.wakeUp()
+        # Don't wait for the server to come back to shut down.
+        self._connections.interrupt()
+
+    def wakeUp(self):
+        """
+        Poll for events and check for plugin changes now rather than at the
+        end of the current poll interval.
+        """
+        self._wakeUp.set()
+        prefetcher = self._prefetcher
+        if prefetcher is not None:
+            prefetcher.wakeUp()
+
+    def _sleep(self, eventCount=None):
+        """
+        Wait for the next poll, or until L{wakeUp} is called.
+
+        @param eventCount: Number of events the last poll got, see
+            L{_PollInterval.update}. If I{None}, the interval is left as is,
+            the prefetcher updates it while it runs.
+        @type eventCount: I{int}
+        """
+        if eventCount is None:
+            interval = self._pollInterval.get()
+        else:
+            interval = self._pollInterval.update(eventCount)
+        self._wakeUp.wait(interval)
+        self._wakeUp.clear()
+
+    def _flushWrites(self):
+        """
+        Send the writes held back by the callbacks registered with
+        batchWrites.
+        """
+        for collection in self._pluginCollections:
+            for plugin in collection:
+                plugin.flushWrites()
+
+    def _reloadPlugins(self):
+        newPlugins = []
+        for collection in self._pluginCollections:
+            for plugin in collection.load():
+                newPlugins.append((collection, plugin))
+
+        # Make sure that newly loaded plugins have proper state, the others
+        # carry on from where they are.
+        if newPlugins:
+            self._seedPluginStates(newPlugins)
+
+        self._updateEventFilter()
+        self._updateEntityFields()
+        self._updateLeanRoutes()
+
+    def _updateEventFilter(self):
+        """
+        Work out which events the active callbacks want from their
+        matchEvents so only those are fetched in full. See
+        L{_buildEventFilter}.
+        """
+        if not self.config.server_side_filters:
+            return
+
+        eventFilter = self._buildEventFilter()
+        if eventFilter != self._eventFilter:
+            self.log.debug("Fetching events matching %s.", eventFilter)
+            self._eventFilter = eventFilter
+            if self._prefetcher is not None:
+                # Batches fetched ahead may be missing events that are now
+                # wanted.
+                self._prefetcher.reset(None)
+
+    def _updateEntityFields(self):
+        """
+        Index the active callbacks that asked for entity fields with
+        registerCallback's entityFields, see L{_hydrateEntities}.
+        """
+        callbacks = []
+        for collection in self._pluginCollections:
+            for plugin in collection:
+                if plugin.isActive():
+                    callbacks.extend(c for c in plugin if c.getEntityFields())
+
+        previous = self._entityFieldRoutes
+        if previous is None or previous.getCallbacks() != callbacks:
+            self._entityFieldRoutes = _RoutingTable(callbacks)
+            if previous is not None and self._prefetcher is not None:
+                # Batches fetched ahead may lack fields that are now wanted.
+                self._prefetcher.reset(None)
+
+    def _updateLeanRoutes(self):
+        """
+        Index the active callbacks by the events they match, so only the
+        events one of them wants are fetched in full. See
+        L{_fetchLeanEvents}.
+        """
+        if not self.config.lean_event_fetch:
+            return
+
+        callbacks = []
+        for collection in self._pluginCollections:
+            for plugin in collection:
+                if plugin.isActive():
+                    callbacks.extend(c for c in plugin if c.isActive())
+
+        previous = self._leanRoutes
+        if previous is None or previous.getCallbacks() != callbacks:
+            self._leanRoutes = _RoutingTable(callbacks)
+            if previous is not None and self._prefetcher is not None:
+                # Batches fetched ahead may be missing events that are now
+                # wanted.
+                self._prefetcher.reset(None)
+
+    def _hydrateEntities(self, sgConnection, events):
+        """
+        Fetch the entity fields callbacks asked for, for a whole batch of
+        events at once, and add them to the events' entity dictionaries.
+
+        One query is made per entity type. Entities that can't be found,
+        retired ones for instance, are left as they are.
+
+        @param sgConnection: The connection to fetch the entities with.
+        @type sgConnection: L{sg.Shotgun}
+        @param events: The events of the batch.
+        @type events: I{list} of Flow Production Tracking event dictionaries.
+        """
+        routes = self._entityFieldRoutes
+        if routes is None or not routes.getCallbacks():
+            return
+
+        wanted = {}
+        for event in events:
+            entity = event.get("entity")
+            if not entity:
+                continue
+            for callback in routes.match(event):
+                fields = callback.getEntityFields(entity["type"])
+                if fields:
+                    fieldNames, entityIds = wanted.setdefault(
+                        entity["type"], (set(), set())
+                    )
+                    fieldNames.update(fields)
+                    entityIds.add(entity["id"])
+
+        for entityType, (fieldNames, entityIds) in wanted.items():
+            try:
+                found = sgConnection.find(
+                    entityType, [["id", "in", sorted(entityIds)]], sorted(fieldNames)
+                )
+            except (sg.ProtocolError, sg.ResponseError, socket.error):
+                # Let the caller retry the whole batch.
+                raise
+            except Exception as err:
+                self.log.error(
+                    "Could not fetch fields %s of %s entities: %s",
+                    ", ".join(sorted(fieldNames)),
+                    entityType,
+                    err,
+                )
+                continue
+
+            found = dict((entity["id"], entity) for entity in found)
+            for event in events:
+                entity = event.get("entity")
+                if entity and entity["type"] == entityType and entity["id"] in found:
+                    entity.update(found[entity["id"]])
+
+    def _buildEventFilter(self):
+        """
+        Build a Shotgun filter accepting the union of the event types and
+        attribute names in the matchEvents of all active callbacks.
+
+        @return: The filter, or I{None} if some callback wants every event.
+        @rtype: I{dict}
+        """
+        anyAttributeTypes = set()
+        attributesByType = {}
+        anyTypeAttributes = set()
+        for collection in self._pluginCollections:
+            for plugin in collection:
+                if not plugin.isActive():
+                    continue
+                for callback in plugin:
+                    if not callback.isActive():
+                        continue
+
+                    matchEvents = callback.getMatchEvents()
+                    if not matchEvents:
+                        return None
+
+                    for eventType, attributes in matchEvents.items():
+                        if attributes is None or "*" in attributes:
+                            if eventType == "*":
+                                return None
+                            anyAttributeTypes.add(eventType)
+                            continue
+
+                        if isinstance(attributes, str):
+                            attributes = [attributes]
+                        attributes = set(a for a in attributes if a)
+                        if eventType == "*":
+                            anyTypeAttributes.update(attributes)
+                        else:
+                            attributesByType.setdefault(eventType, set()).update(
+                                attributes
+                            )
+
+        filters = []
+        if anyAttributeTypes:
+            filters.append(["event_type", "in", sorted(anyAttributeTypes)])
+        for eventType, attributes in sorted(attributesByType.items()):
+            if eventType not in anyAttributeTypes and attributes:
+                filters.append(
+                    {
+                        "filter_operator": "all",
+                        "filters": [
+                            ["event_type", "is", eventType],
+                            ["attribute_name", "in", sorted(attributes)],
+                        ],
+                    }
+                )
+        if anyTypeAttributes:
+            filters.append(["attribute_name", "in", sorted(anyTypeAttributes)])
+
+        if not filters:
+            return None
+        if self._schemaCache is not None:
+            # The schema cache needs to see the schema changes.
+            filters.append(
+                [
+                    "event_type",
+                    "in",
+                    sorted(shotgun_proxy.SchemaCache.SCHEMA_EVENT_TYPES),
+                ]
+            )
+        return {"filter_operator": "any", "filters": filters}
+
+    def _updateLanes(self):
+        """
+        Move the plugins far behind the others to the catch-up lane, and back
+        to the fast lane once they reach it.
+
+        Plugins on the fast lane get the events at the head of the event log.
+        Plugins on the catch-up lane, a plugin re-enabled after a while for
+        example, get older events fetched for them only, so the other plugins
+        don't wait for them nor download those events again.
+
+        @return: The id of the next event of the fast lane and of the
+            catch-up lane, I{None} for a lane without plugins.
+        @rtype: I{tuple}
+        """
+        nextIds = {}
+        for collection in self._pluginCollections:
+            for plugin in collection:
+                if plugin.isActive():
+                    nextId = plugin.getNextUnprocessedEventId()
+                    if nextId is not None:
+                        nextIds[plugin] = nextId
+
+        threshold = self.config.catch_up_threshold
+        if not threshold or not nextIds:
+            self._catchingUp.clear()
+        else:
+            # Forget the plugins which were deactivated or removed.
+            self._catchingUp.intersection_update(nextIds)
+
+            head = max(nextIds.values())
+            for plugin, nextId in nextIds.items():
+                if plugin not in self._catchingUp and head - nextId > threshold:
+                    self.log.info(
+                        "Plugin %s is %d events behind, catching up on its own.",
+                        plugin,
+                        head - nextId,
+                    )
+                    self._catchingUp.add(plugin)
+
+        fastIds = [n for p, n in nextIds.items() if p not in self._catchingUp]
+        fastCursor = min(fastIds) if fastIds else None
+        for plugin in list(self._catchingUp):
+            if fastCursor is not None and nextIds[plugin] >= fastCursor:
+                self.log.info("Plugin %s caught up.", plugin)
+                self._catchingUp.discard(plugin)
+
+        catchUpIds = [nextIds[p] for p in self._catchingUp]
+        return fastCursor, min(catchUpIds) if catchUpIds else None
+
+    def isCatchingUp(self, plugin):
+        """
+        @return: True if the plugin is on the catch-up lane, see
+            L{_updateLanes}.
+        @rtype: I{bool}
+        """
+        return plugin in self._catchingUp
+
+    def _getCatchUpEvents(self):
+        """
+        Fetch the next batch of events of the plugins on the catch-up lane.
+
+        @return: Events for the plugins catching up only.
+        @rtype: I{list} of Flow Production Tracking event dictionaries.
+        """
+        catchUpCursor = self._updateLanes()[1]
+        if catchUpCursor is None:
+            self._catchUpBatchSize.fetched(0)
+            return []
+        return self._fetchBatch(
+            self._sg, self._catchUpBatchSize, catchUpCursor, self._catchUpRangeFetcher
+        )
 
     def _getNewEvents(self):
         """
         Fetch new events from Shotgun.
 
-        @return: Recent events that need to be processed by the engine.
+        @return: Recent events that need to be processed by the plugins on
+            the fast lane, see L{_updateLanes}.
         @rtype: I{list} of Flow Production Tracking event dictionaries.
         """
-        nextEventId = None
-        for newId in [
-            coll.getNextUnprocessedEventId() for coll in self._pluginCollections
-        ]:
-            if newId is not None and (nextEventId is None or newId < nextEventId):
-                nextEventId = newId
-
-        if nextEventId is not None:
-            filters = [["id", "greater_than", nextEventId - 1]]
-            fields = [
-                "id",
-                "event_type",
-                "attribute_name",
-                "meta",
-                "entity",
-                "user",
-                "project",
-                "session_uuid",
-                "created_at",
-            ]
-            order = [{"column": "id", "direction": "asc"}]
+        nextEventId = self._updateLanes()[0]
 
-            conn_attempts = 0
-            while True:
-                try:
-                    events = self._sg.find(
+        if nextEventId is None:
+            if self._prefetcher is not None:
+                # The prefetcher owns the lane's batch size while it runs.
+                self._sleep()
+            else:
+                self._batchSize.fetched(0)
+            return []
+
+        if self._prefetcher is not None:
+            return self._prefetcher.getEvents(nextEventId)
+
+        return self._fetchBatch(
+            self._sg, self._batchSize, nextEventId, self._rangeFetcher
+        )
+
+    def _fetchBatch(self, sgConnection, batchSize, nextEventId, rangeFetcher):
+        """
+        Fetch the next batch of events of a lane, as many as the lane's
+        L{_BatchSize} allows for how far behind it is.
+
+        While the lane is more than parallel_fetch_threshold events behind,
+        the events up to the last one are fetched in windows over several
+        connections at once, see L{_RangeFetcher}.
+
+        @param sgConnection: The connection to fetch the events with.
+        @type sgConnection: L{sg.Shotgun}
+        @param batchSize: The batch size of the lane.
+        @type batchSize: L{_BatchSize}
+        @param nextEventId: The id of the first event to fetch.
+        @type nextEventId: I{int}
+        @param rangeFetcher: The range fetcher of the lane.
+        @type rangeFetcher: L{_RangeFetcher}
+
+        @return: Events starting at nextEventId, in id order.
+        @rtype: I{list} of Flow Production Tracking event dictionaries.
+        """
+        lag = None
+        headEventId = None
+        if batchSize.isBehind():
+            headEventId = self._getHeadEventId(sgConnection)
+            if headEventId is not None:
+                lag = headEventId - nextEventId + 1
+        limit = batchSize.get(lag)
+
+        events = None
+        if (
+            rangeFetcher.isEnabled()
+            and lag is not None
+            and lag > self.config.parallel_fetch_threshold
+        ):
+            events = rangeFetcher.getEvents(
+                sgConnection, nextEventId, headEventId, limit
+            )
+        else:
+            rangeFetcher.reset()
+
+        if events is None:
+            mode = "sequential"
+            events = self._fetchEvents(sgConnection, nextEventId, limit)
+            batchSize.fetched(len(events))
+        else:
+            # Windows have gaps in their ids, more are waiting until the
+            # head is reached.
+            mode = "parallel"
+            batchSize.fetched(len(events), more=True)
+
+        if self.timing_logger:
+            self.timing_logger.info(
+                "fetch next_event_id=%d batch_size=%d lag=%s event_cost=%.4f "
+                "events=%d mode=%s",
+                nextEventId,
+                limit,
+                lag,
+                batchSize.getCost(),
+                len(events),
+                mode,
+            )
+        if events:
+            self._updateHeadEventId(events[-1]["id"])
+        if self._archive is not None:
+            self._archive.append(events, start=nextEventId)
+        return events
+
+    def _getHeadEventId(self, sgConnection):
+        """
+        @return: The id of the last event in the event log, checked once
+            every L{HEAD_CHECK_INTERVAL} seconds at most, I{None} if it isn't
+            known.
+        @rtype: I{int}
+        """
+        now = time.monotonic()
+        with self._headLock:
+            check = (
+                self._headCheckTime is None
+                or now - self._headCheckTime > self.HEAD_CHECK_INTERVAL
+            )
+            if check:
+                self._headCheckTime = now
+
+        if check:
+            try:
+                result = sgConnection.find_one(
+                    "EventLogEntry",
+                    filters=[],
+                    fields=["id"],
+                    order=[{"column": "id", "direction": "desc"}],
+                )
+            except Exception as err:
+                self.log.debug("Could not get the last event id: %s", err)
+            else:
+                if result:
+                    self._updateHeadEventId(result["id"])
+
+        with self._headLock:
+            return self._headEventId
+
+    def _updateHeadEventId(self, eventId):
+        # The lanes fetch on the main thread and on the prefetcher's.
+        with self._headLock:
+            if self._headEventId is None or eventId > self._headEventId:
+                self._headEventId = eventId
+
+    def _recordProgress(self):
+        """
+        Tell each lane's L{_BatchSize} how far all of its plugins got, so it
+        knows which of its batches are done and how long they took.
+
+        Plugins may process their events on other threads, events are only
+        done once every plugin of the lane processed them.
+        """
+        done = {self._batchSize: None, self._catchUpBatchSize: None}
+        for collection in self._pluginCollections:
+            for plugin in collection:
+                lastEventId = plugin.getLastEventId()
+                if not plugin.isActive() or lastEventId is None:
+                    continue
+                if self.isCatchingUp(plugin):
+                    batchSize = self._catchUpBatchSize
+                else:
+                    batchSize = self._batchSize
+                if done[batchSize] is None or lastEventId < done[batchSize]:
+                    done[batchSize] = lastEventId
+
+        for batchSize, lastEventId in done.items():
+            batchSize.completed(lastEventId)
+
+    def _getBacklogEvents(self):
+        """
+        Fetch the events plugins are waiting for in their backlog.
+
+        Only the missing ids are asked for, so a hole in the event ids
+        doesn't make every poll download everything after it again.
+
+        @return: The backlog events that showed up, in id order.
+        @rtype: I{list} of Flow Production Tracking event dictionaries.
+        """
+        ranges = []
+        for collection in self._pluginCollections:
+            ranges.extend(collection.getBacklogRanges())
+        if not ranges:
+            return []
+
+        # Merge the ranges of all plugins.
+        merged = []
+        for start, end in sorted(ranges):
+            if merged and start <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        merged = merged[: self.config.getMaxEventBatchSize()]
+
+        filters = []
+        singleIds = [start for start, end in merged if start == end]
+        if singleIds:
+            filters.append(["id", "in", singleIds])
+        for start, end in merged:
+            if start != end:
+                filters.append(["id", "between", [start, end]])
+        if len(filters) > 1:
+            filters = [{"filter_operator": "any", "filters": filters}]
+
+        events = self._findEvents(self._sg, filters)
+        if self._archive is not None:
+            self._archive.append(events, late=True)
+        return events
+
+    def _fetchEvents(self, sgConnection, nextEventId, limit=None):
+        """
+        Fetch a batch of events starting at a given id, retrying until Shotgun
+        answers.
+
+        @param sgConnection: The connection to fetch the events with.
+        @type sgConnection: L{sg.Shotgun}
+        @param nextEventId: The id of the first event to fetch.
+        @type nextEventId: I{int}
+        @param limit: Maximum number of events to fetch, defaults to
+            L{Config.getMaxEventBatchSize}.
+        @type limit: I{int}
+
+        @return: Up to limit events, in id order.
+        @rtype: I{list} of Flow Production Tracking event dictionaries.
+        """
+        return self._findEvents(
+            sgConnection, [["id", "greater_than", nextEventId - 1]], limit
+        )
+
+    def _findEvents(self, sgConnection, filters, limit=None):
+        """
+        Fetch a batch of events matching filters, retrying until Shotgun
+        answers.
+
+        @param sgConnection: The connection to fetch the events with.
+        @type sgConnection: L{sg.Shotgun}
+        @param filters: The filters on the events' ids.
+        @type filters: I{list}
+        @param limit: Maximum number of events to fetch, defaults to
+            L{Config.getMaxEventBatchSize}.
+        @type limit: I{int}
+
+        @return: Up to limit events, in id order.
+        @rtype: I{list} of Flow Production Tracking event dictionaries.
+        """
+        if limit is None:
+            limit = self.config.getMaxEventBatchSize()
+        fields = [
+            "id",
+            "event_type",
+            "attribute_name",
+            "meta",
+            "entity",
+            "user",
+            "project",
+            "session_uuid",
+            "created_at",
+        ]
+        order = [{"column": "id", "direction": "asc"}]
+
+        eventFilter = self._eventFilter
+        leanRoutes = self._leanRoutes
+
+        conn_attempts = 0
+        while True:
+            try:
+                if leanRoutes is not None:
+                    events = self._fetchLeanEvents(
+                        sgConnection, filters, fields, order, leanRoutes, limit
+                    )
+                elif eventFilter is None:
+                    events = sgConnection.find(
                         "EventLogEntry",
                         filters,
                         fields,
                         order,
-                        limit=self.config.getMaxEventBatchSize(),
+                        limit=limit,
                     )
-                    if events:
-                        self.log.debug(
-                            "Got %d events: %d to %d.",
-                            len(events),
-                            events[0]["id"],
-                            events[-1]["id"],
-                        )
-                    return events
-                except (sg.ProtocolError, sg.ResponseError, socket.error) as err:
-                    conn_attempts = self._checkConnectionAttempts(
-                        conn_attempts, str(err)
+                else:
+                    events = self._fetchFilteredEvents(
+                        sgConnection, filters, fields, order, eventFilter, limit
+                    )
+                self._hydrateEntities(sgConnection, events)
+                if self._schemaCache is not None and self._schemaCache.processEvents(
+                    events
+                ):
+                    self.log.debug("The schema changed, dropped the schema cache.")
+                if events:
+                    self.log.debug(
+                        "Got %d events: %d to %d.",
+                        len(events),
+                        events[0]["id"],
+                        events[-1]["id"],
                     )
-                except Exception as err:
-                    msg = "Unknown error: %s" % str(err)
-                    conn_attempts = self._checkConnectionAttempts(conn_attempts, msg)
+                return events
+            except (sg.ProtocolError, sg.ResponseError, socket.error) as err:
+                conn_attempts = self._checkConnectionAttempts(conn_attempts, str(err))
+            except Exception as err:
+                msg = "Unknown error: %s" % str(err)
+                conn_attempts = self._checkConnectionAttempts(conn_attempts, msg)
+            if not self._continue:
+                # Shutting down, don't wait for Shotgun to be back.
+                return []
 
-        return []
+    def _fetchFilteredEvents(
+        self, sgConnection, filters, fields, order, eventFilter, limit
+    ):
+        """
+        Fetch a batch of events, only downloading all the fields of the ones
+        matching the event filter.
+
+        Plugins must still see every event id to move their last event id and
+        tell missing events from filtered ones, so the ids and creation dates
+        of the batch are listed first. Events not matching the filter are
+        returned as stubs without any other field, they are never routed to
+        a callback.
+        """
+        listed = sgConnection.find(
+            "EventLogEntry",
+            filters,
+            ["id", "created_at"],
+            order,
+            limit=limit,
+        )
+        if not listed:
+            return []
+
+        events = {}
+        for entry in listed:
+            event = dict.fromkeys(fields)
+            event.update(entry)
+            events[entry["id"]] = event
+
+        idRange = ["id", "between", [listed[0]["id"], listed[-1]["id"]]]
+        for event in sgConnection.find(
+            "EventLogEntry", [idRange, eventFilter], fields, order
+        ):
+            events[event["id"]] = event
+
+        return [events[eventId] for eventId in sorted(events)]
+
+    def _fetchLeanEvents(self, sgConnection, filters, fields, order, routes, limit):
+        """
+        Fetch a batch of events, only downloading all the fields of the ones
+        an active callback routes.
 
-    def _saveEventIdData(self):
+        The batch is listed with the fields routing needs first, then the
+        events routed to a callback are fetched in full with a single query.
+        The other events are returned as stubs, like in
+        L{_fetchFilteredEvents}, so their large meta never gets downloaded.
+        """
+        listed = sgConnection.find(
+            "EventLogEntry",
+            filters,
+            ["id", "event_type", "attribute_name", "created_at"],
+            order,
+            limit=limit,
+        )
+        if not listed:
+            return []
+
+        # Schema changes must reach the schema cache whoever routes them.
+        schemaEventTypes = ()
+        if self._schemaCache is not None:
+            schemaEventTypes = shotgun_proxy.SchemaCache.SCHEMA_EVENT_TYPES
+
+        events = {}
+        routed = []
+        for entry in listed:
+            event = dict.fromkeys(fields)
+            event["id"] = entry["id"]
+            event["created_at"] = entry["created_at"]
+            events[entry["id"]] = event
+            if routes.match(entry) or entry["event_type"] in schemaEventTypes:
+                routed.append(entry["id"])
+
+        if len(routed) == len(listed):
+            idFilter = ["id", "between", [routed[0], routed[-1]]]
+        elif routed:
+            idFilter = ["id", "in", routed]
+        else:
+            idFilter = None
+
+        if idFilter is not None:
+            for event in sgConnection.find("EventLogEntry", [idFilter], fields, order):
+                events[event["id"]] = event
+
+        return [events[eventId] for eventId in sorted(events)]
+
+    def _saveEventIdData(self, compact=False):
         """
         Save an event Id to persistant storage.
 
         Next time the engine is started it will try to read the event id from
         this location to know at which event it should start processing.
-        """
-        eventIdFile = self.config.getEventIdFile()
 
-        if eventIdFile is not None:
+        Only the plugin states that changed are appended to the checkpoint
+        journal, see L{checkpoint_journal.CheckpointJournal}.
+
+        @param compact: Rewrite the whole event id file and empty the journal.
+        @type compact: I{bool}
+        """
+        if self._checkpoint is not None:
             for collection in self._pluginCollections:
                 self._eventIdData[collection.path] = collection.getState()
 
             for colPath, state in self._eventIdData.items():
                 if state:
                     try:
-                        with open(eventIdFile, "wb") as fh:
-                            # Use protocol 2 so it can also be loaded in Python 2
-                            pickle.dump(self._eventIdData, fh, protocol=2)
+                        if compact:
+                            self._checkpoint.compact(self._eventIdData)
+                        else:
+                            self._checkpoint.save(self._eventIdData)
                     except OSError as err:
                         self.log.error(
                             "Can not write event id data to %s.\n\n%s",
-                            eventIdFile,
+                            self._checkpoint.path,
                             traceback.format_exc(),
                         )
                     break
@@ -613,56 +1504,618 @@ class Engine(object):
                 self.log.warning("No state was found. Not saving to disk.")
 
     def _checkConnectionAttempts(self, conn_attempts, msg):
+        """
+        Log a failed attempt to reach Shotgun and wait before the next one,
+        a bit longer after every attempt, up to conn_retry_sleep seconds.
+
+        @return: The number of attempts which failed so far.
+        @rtype: I{int}
+        """
         conn_attempts += 1
-        if conn_attempts == self._max_conn_retries:
-            self.log.error(
-                "Unable to connect to SG (attempt %s of %s): %s",
-                conn_attempts,
-                self._max_conn_retries,
-                msg,
-            )
-            conn_attempts = 0
-            time.sleep(self._conn_retry_sleep)
+        delay = shotgun_proxy.backoffDelay(conn_attempts, self._conn_retry_sleep)
+        # Alert every max_conn_retries attempts.
+        if conn_attempts % self._max_conn_retries == 0:
+            log = self.log.error
         else:
-            self.log.warning(
-                "Unable to connect to SG (attempt %s of %s): %s",
-                conn_attempts,
-                self._max_conn_retries,
-                msg,
-            )
+            log = self.log.warning
+        log(
+            "Unable to connect to SG (attempt %s): %s. Retrying in %.1f seconds.",
+            conn_attempts,
+            msg,
+            delay,
+        )
+        time.sleep(delay)
         return conn_attempts
 
 
-class PluginCollection(object):
+class AsyncEngine(Engine):
     """
-    A group of plugin files in a location on the disk.
+    An engine running the event processing loop on an asyncio event loop.
+
+    Fetching, checkpointing and dispatching are coroutines. Every plugin has
+    its own queue drained by its own task, so a plugin sees its events in
+    order while unrelated plugins process theirs concurrently. Coroutine
+    callbacks are awaited on the loop and their Shotgun calls run on the
+    loop's executor, other callbacks run on the executor. The number of
+    coroutine callbacks' calls and other callbacks running at once for a
+    script key is bounded by the callback_concurrency_per_key setting.
     """
 
-    def __init__(self, engine, path):
-        if not os.path.isdir(path):
-            raise ValueError("Invalid path: %s" % path)
-
-        self._engine = engine
-        self.path = path
-        self._plugins = {}
-        self._stateData = {}
+    def __init__(self, configPath):
+        super(AsyncEngine, self).__init__(configPath)
+        self._queues = {}
+        self._consumers = {}
+        self._scriptSemaphores = {}
+        self._busy = 0
+        self._dispatching = None
+        self._idle = None
+
+    def getScriptSemaphore(self, scriptKey):
+        """
+        Get the semaphore bounding the callbacks running with a script key.
 
-    def setState(self, state):
-        if isinstance(state, int):
-            for plugin in self:
-                plugin.setState(state)
-                self._stateData[plugin.getName()] = plugin.getState()
-        else:
-            self._stateData = state
-            for plugin in self:
-                pluginState = self._stateData.get(plugin.getName())
-                if pluginState:
-                    plugin.setState(pluginState)
+        @param scriptKey: The script key the callbacks connect with.
+        @type scriptKey: I{str}
 
-    def getState(self):
-        for plugin in self:
-            self._stateData[plugin.getName()] = plugin.getState()
-        return self._stateData
+        @rtype: L{asyncio.Semaphore}
+        """
+        semaphore = self._scriptSemaphores.get(scriptKey)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(
+                max(1, self.config.callback_concurrency_per_key)
+            )
+            self._scriptSemaphores[scriptKey] = semaphore
+        return semaphore
+
+    def _mainLoop(self):
+        """
+        Run the event processing loop until the engine is stopped.
+
+        See L{Engine._mainLoop} for the general behavior.
+        """
+        self.log.debug("Starting the asyncio event processing loop.")
+        asyncio.run(self._asyncMainLoop())
+        self.log.debug("Shuting down event processing loop.")
+
+    async def _asyncMainLoop(self):
+        loop = asyncio.get_running_loop()
+        loop.set_default_executor(
+            concurrent.futures.ThreadPoolExecutor(
+                max_workers=self.config.dispatch_threads or None,
+                thread_name_prefix="AsyncEngine",
+            )
+        )
+        self._dispatching = asyncio.Event()
+        self._dispatching.set()
+        self._idle = asyncio.Condition()
+
+        try:
+            while self._continue:
+                # Plugins work through their queues while the next batch is
+                # being fetched.
+                backlogEvents = await loop.run_in_executor(None, self._getBacklogEvents)
+                for event in backlogEvents:
+                    for collection in self._pluginCollections:
+                        for plugin in collection:
+                            if plugin.isActive() and plugin.isInBacklog(event["id"]):
+                                await self._enqueue(plugin, event)
+
+                events = await loop.run_in_executor(None, self._getNewEvents)
+                self._batchSize.dispatched(events)
+                for event in events:
+                    for collection in self._pluginCollections:
+                        for plugin in collection:
+                            if self.isCatchingUp(plugin):
+                                continue
+                            if plugin.isActive():
+                                await self._enqueue(plugin, event)
+                            else:
+                                plugin.logger.debug("Skipping: inactive.")
+
+                catchUpEvents = await loop.run_in_executor(None, self._getCatchUpEvents)
+                self._catchUpBatchSize.dispatched(catchUpEvents)
+                for event in catchUpEvents:
+                    for collection in self._pluginCollections:
+                        for plugin in collection:
+                            if plugin.isActive() and self.isCatchingUp(plugin):
+                                await self._enqueue(plugin, event)
+
+                await loop.run_in_executor(None, self._flushWrites)
+                await loop.run_in_executor(None, self._saveEventIdData)
+                self._recordProgress()
+
+                if (
+                    not self._batchSize.isBehind()
+                    and not self._catchUpBatchSize.isBehind()
+                ):
+                    await loop.run_in_executor(
+                        None, self._sleep, len(events) + len(catchUpEvents)
+                    )
+
+                # Plugins must not be reloaded or have their state changed
+                # while they are processing an event.
+                async with self._paused():
+                    await loop.run_in_executor(None, self._flushWrites)
+                    await loop.run_in_executor(None, self._saveEventIdData)
+                    await loop.run_in_executor(None, self._reloadPlugins)
+                    self._dropConsumers(self._removedPlugins())
+        finally:
+            async with self._paused():
+                self._dropConsumers(list(self._consumers))
+            await loop.run_in_executor(None, self._finishProcessing)
+
+    async def _enqueue(self, plugin, event):
+        queue = self._queues.get(plugin)
+        if queue is None:
+            queue = asyncio.Queue(max(1, self.config.plugin_queue_size))
+            self._queues[plugin] = queue
+            self._consumers[plugin] = asyncio.create_task(self._consume(plugin, queue))
+
+        while True:
+            try:
+                await asyncio.wait_for(queue.put(event), 1)
+                break
+            except asyncio.TimeoutError:
+                if not self._continue:
+                    return
+        plugin.setDispatchedEventId(event["id"])
+
+    async def _consume(self, plugin, queue):
+        while True:
+            event = await queue.get()
+            # The flag may be cleared again by the time this task wakes up.
+            while not self._dispatching.is_set():
+                await self._dispatching.wait()
+
+            if not plugin.isActive():
+                plugin.logger.debug(
+                    "Dropping %d queued events: inactive.", queue.qsize() + 1
+                )
+                self._clearQueue(plugin, queue)
+                continue
+
+            self._busy += 1
+            try:
+                await plugin.processAsync(event)
+            except Exception:
+                self.log.critical(
+                    "Unexpected error dispatching event %d to plugin %s.\n\n%s",
+                    event["id"],
+                    plugin,
+                    traceback.format_exc(),
+                )
+            finally:
+                self._busy -= 1
+                async with self._idle:
+                    self._idle.notify_all()
+
+    @contextlib.asynccontextmanager
+    async def _paused(self):
+        """
+        Context manager holding back the plugin tasks. Events being processed
+        when entering are finished first, queued events wait until the context
+        is left.
+        """
+        self._dispatching.clear()
+        async with self._idle:
+            await self._idle.wait_for(lambda: not self._busy)
+        try:
+            yield
+        finally:
+            self._dispatching.set()
+
+    def _removedPlugins(self):
+        current = set()
+        for collection in self._pluginCollections:
+            current.update(collection)
+        return [plugin for plugin in self._consumers if plugin not in current]
+
+    def _dropConsumers(self, plugins):
+        """
+        Cancel the tasks of some plugins and drop their queued events. Dropped
+        events will be fetched again.
+        """
+        for plugin in plugins:
+            self._consumers.pop(plugin).cancel()
+            self._clearQueue(plugin, self._queues.pop(plugin))
+
+    def _clearQueue(self, plugin, queue):
+        while not queue.empty():
+            queue.get_nowait()
+        plugin.setDispatchedEventId(None)
+
+
+class EventPrefetcher(threading.Thread):
+    """
+    Fetch the next windows of events in a background thread while the engine
+    dispatches the current one.
+
+    Fetched batches are handed to the engine through a bounded queue so the
+    prefetcher never gets more than a few batches ahead of the dispatching.
+    """
+
+    def __init__(self, engine, queueSize):
+        """
+        @param engine: The engine the events are fetched for.
+        @type engine: L{Engine}
+        @param queueSize: Maximum number of batches fetched ahead.
+        @type queueSize: I{int}
+        """
+        super(EventPrefetcher, self).__init__(name="EventPrefetcher")
+        self.daemon = True
+
+        self._engine = engine
+        self._queue = queue.Queue(maxsize=queueSize)
+        self._condition = threading.Condition()
+        self._stopped = threading.Event()
+        self._wakeUp = threading.Event()
+        self._cursor = None
+        self._generation = 0
+
+        self._sg = engine.getShotgun(
+            engine.config.getEngineScriptName(), engine.config.getEngineScriptKey()
+        )
+
+    def run(self):
+        while not self._stopped.is_set():
+            with self._condition:
+                while self._cursor is None and not self._stopped.is_set():
+                    self._condition.wait()
+                generation, cursor = self._generation, self._cursor
+
+            if self._stopped.is_set():
+                break
+
+            batchSize = self._engine._batchSize
+            events = self._engine._fetchBatch(
+                self._sg, batchSize, cursor, self._engine._rangeFetcher
+            )
+
+            with self._condition:
+                if generation != self._generation:
+                    # The engine asked for another window while we were
+                    # fetching, this batch is of no use.
+                    continue
+                if events:
+                    self._cursor = events[-1]["id"] + 1
+
+            self._put((generation, cursor, events))
+
+            if not batchSize.isBehind():
+                self._wakeUp.wait(self._engine._pollInterval.update(len(events)))
+                self._wakeUp.clear()
+
+    def _put(self, item):
+        # Wait for room in the queue, this is where backpressure happens.
+        while not self._stopped.is_set():
+            try:
+                self._queue.put(item, timeout=1)
+                return
+            except queue.Full:
+                pass
+
+    def reset(self, cursor):
+        """
+        Restart fetching from the given event id, dropping any batch fetched
+        ahead from another position.
+
+        @param cursor: The id of the next event the engine needs.
+        @type cursor: I{int}
+        """
+        with self._condition:
+            self._generation += 1
+            self._cursor = cursor
+            self._condition.notify_all()
+
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+
+    def getEvents(self, nextEventId):
+        """
+        Get the next batch of events, waiting for it to be fetched if needed.
+
+        @param nextEventId: The id of the next event the engine needs.
+        @type nextEventId: I{int}
+
+        @return: Events starting at nextEventId, in id order.
+        @rtype: I{list} of Flow Production Tracking event dictionaries.
+        """
+        if self._cursor is None:
+            self.reset(nextEventId)
+
+        while self._engine._continue:
+            try:
+                generation, cursor, events = self._queue.get(timeout=1)
+            except queue.Empty:
+                continue
+
+            if generation != self._generation:
+                continue
+
+            if cursor != nextEventId:
+                # Plugins were loaded or reloaded with a different state since
+                # the batch was fetched.
+                self._engine.log.debug(
+                    "Prefetched events start at %d, %d needed. Refetching.",
+                    cursor,
+                    nextEventId,
+                )
+                self.reset(nextEventId)
+                continue
+
+            return events
+
+        return []
+
+    def wakeUp(self):
+        """
+        Fetch the next batch now rather than at the end of the poll interval.
+        """
+        self._wakeUp.set()
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeUp.set()
+        with self._condition:
+            self._condition.notify_all()
+
+
+class PluginDispatcher(object):
+    """
+    Dispatch events to plugins on a pool of threads.
+
+    Every plugin has its own queue of pending events which is drained by at
+    most one pool thread at a time, so a plugin sees its events in order while
+    unrelated plugins process theirs concurrently.
+    """
+
+    def __init__(self, engine, maxWorkers, queueSize):
+        """
+        @param engine: The engine dispatching the events.
+        @type engine: L{Engine}
+        @param maxWorkers: Number of dispatch threads.
+        @type maxWorkers: I{int}
+        @param queueSize: Maximum number of pending events per plugin.
+        @type queueSize: I{int}
+        """
+        self._engine = engine
+        self._queueSize = max(1, queueSize)
+        self._pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=maxWorkers, thread_name_prefix="PluginDispatcher"
+        )
+        self._condition = threading.Condition()
+        self._queues = {}
+        self._draining = set()
+        self._busy = 0
+        self._paused = False
+
+    def submit(self, plugin, event):
+        """
+        Queue an event for a plugin, waiting for room in the plugin's queue if
+        it is full.
+
+        @param plugin: The plugin that should process the event.
+        @type plugin: L{Plugin}
+        @param event: The Flow Production Tracking event to process.
+        @type event: I{dict}
+        """
+        with self._condition:
+            pending = self._queues.setdefault(plugin, collections.deque())
+            idle = not pending and plugin not in self._draining
+
+        if idle and not plugin.getMatchingCallbacks(event):
+            # Only the plugin's bookkeeping needs the event, no use handing it
+            # to a thread. Nothing else starts work on the plugin meanwhile.
+            plugin.process(event)
+            return
+
+        with self._condition:
+            while len(pending) >= self._queueSize:
+                if not self._engine._continue:
+                    return
+                self._condition.wait(1)
+
+            pending.append(event)
+            plugin.setDispatchedEventId(event["id"])
+
+            if plugin not in self._draining:
+                self._draining.add(plugin)
+                self._pool.submit(self._drain, plugin)
+
+    def _drain(self, plugin):
+        while True:
+            with self._condition:
+                while self._paused:
+                    self._condition.wait()
+
+                pending = self._queues[plugin]
+                if pending and not plugin.isActive():
+                    plugin.logger.debug(
+                        "Dropping %d queued events: inactive.", len(pending)
+                    )
+                    pending.clear()
+                    plugin.setDispatchedEventId(None)
+
+                if not pending:
+                    self._draining.discard(plugin)
+                    self._condition.notify_all()
+                    return
+
+                event = pending.popleft()
+                self._busy += 1
+                self._condition.notify_all()
+
+            try:
+                plugin.process(event)
+            except Exception:
+                self._engine.log.critical(
+                    "Unexpected error dispatching event %d to plugin %s.\n\n%s",
+                    event["id"],
+                    plugin,
+                    traceback.format_exc(),
+                )
+            finally:
+                with self._condition:
+                    self._busy -= 1
+                    self._condition.notify_all()
+
+    @contextlib.contextmanager
+    def paused(self):
+        """
+        Context manager holding back the dispatch threads. Events being
+        processed when entering are finished first, queued events wait until
+        the context is left.
+        """
+        with self._condition:
+            self._paused = True
+            while self._busy:
+                self._condition.wait()
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._paused = False
+                self._condition.notify_all()
+
+    def shutdown(self):
+        """
+        Drop all queued events and wait for the ones being processed to
+        finish. Dropped events will be fetched again on the next start.
+        """
+        with self._condition:
+            for plugin, pending in self._queues.items():
+                pending.clear()
+                plugin.setDispatchedEventId(None)
+            self._condition.notify_all()
+
+        self._pool.shutdown(wait=True)
+
+
+class PluginHost(object):
+    """
+    A pool of worker processes running the callbacks of the plugins listed in
+    the process_plugins setting.
+
+    The thread dispatching an event waits for the worker's answer, so the
+    plugin's event id bookkeeping works as for any other callback. Running
+    several callbacks at once requires dispatch threads or partitioned
+    callbacks.
+    """
+
+    def __init__(self, engine, maxWorkers=None):
+        """
+        @param engine: The engine the plugins are hosted for.
+        @type engine: L{Engine}
+        @param maxWorkers: Number of worker processes, defaults to the number
+            of CPUs.
+        @type maxWorkers: I{int}
+        """
+        self._engine = engine
+        self._maxWorkers = maxWorkers
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def _getPool(self):
+        with self._lock:
+            if self._pool is None:
+                # Forking a process running threads is asking for deadlocks,
+                # always start the workers from scratch.
+                self._pool = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self._maxWorkers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._pool
+
+    def run(self, callback, pluginPath, index, logger, event):
+        """
+        Run a callback on an event in a worker process.
+
+        @param callback: The callback to run.
+        @type callback: L{Callback}
+        @param pluginPath: The path of the plugin the callback belongs to.
+        @type pluginPath: I{str}
+        @param index: The position of the callback in its plugin.
+        @type index: I{int}
+        @param logger: The callback's logger, records logged in the worker are
+            replayed on it.
+        @type logger: L{logging.Logger}
+        @param event: The Flow Production Tracking event to process.
+        @type event: I{dict}
+
+        @raise plugin_host.PluginHostError: If the callback failed or the
+            worker process died.
+        """
+        pool = self._getPool()
+        try:
+            future = pool.submit(
+                plugin_host.runCallback,
+                pluginPath,
+                index,
+                str(callback),
+                logger.name,
+                logger.getEffectiveLevel(),
+                event,
+                self._engine.config.getShotgunURL(),
+                self._engine.config.getEngineProxyServer(),
+                self._engine._use_session_uuid,
+            )
+            success, error, records = future.result()
+        except concurrent.futures.process.BrokenProcessPool:
+            with self._lock:
+                # Only the first thread seeing the broken pool replaces it.
+                if self._pool is pool:
+                    self._pool = None
+            pool.shutdown(wait=False)
+            raise plugin_host.PluginHostError(
+                "A worker process died while processing event %d." % event["id"], ""
+            )
+
+        for levelno, message in records:
+            logger.log(levelno, message)
+
+        if not success:
+            raise plugin_host.PluginHostError(*error)
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=True)
+                self._pool = None
+
+
+class PluginCollection(object):
+    """
+    A group of plugin files in a location on the disk.
+    """
+
+    def __init__(self, engine, path):
+        if not os.path.isdir(path):
+            raise ValueError("Invalid path: %s" % path)
+
+        self._engine = engine
+        self.path = path
+        self._plugins = {}
+        self._stateData = {}
+
+    def setState(self, state):
+        if isinstance(state, int):
+            for plugin in self:
+                plugin.setState(state)
+                self._stateData[plugin.getName()] = plugin.getState()
+        else:
+            self._stateData = state
+            for plugin in self:
+                pluginState = self._stateData.get(plugin.getName())
+                if pluginState:
+                    plugin.setState(pluginState)
+
+    def getState(self):
+        for plugin in self:
+            self._stateData[plugin.getName()] = plugin.getState()
+        return self._stateData
 
     def getNextUnprocessedEventId(self):
         eId = None
@@ -675,10 +2128,38 @@ class PluginCollection(object):
                 eId = newId
         return eId
 
-    def process(self, event):
+    def getBacklogRanges(self):
+        ranges = []
         for plugin in self:
             if plugin.isActive():
-                plugin.process(event)
+                ranges.extend(plugin.getBacklogRanges())
+        return ranges
+
+    def process(self, event, backlogOnly=False, catchingUp=False):
+        """
+        Hand an event to the plugins of the collection.
+
+        @param event: The Flow Production Tracking event to process.
+        @type event: I{dict}
+        @param backlogOnly: Only hand the event to plugins waiting for it in
+            their backlog. The others already went past it.
+        @type backlogOnly: I{bool}
+        @param catchingUp: The event was fetched for the plugins on the
+            engine's catch-up lane rather than for the ones on the fast lane.
+        @type catchingUp: I{bool}
+        """
+        dispatcher = self._engine._dispatcher
+        for plugin in self:
+            if backlogOnly:
+                if not plugin.isInBacklog(event["id"]):
+                    continue
+            elif self._engine.isCatchingUp(plugin) != catchingUp:
+                continue
+            if plugin.isActive():
+                if dispatcher is not None:
+                    dispatcher.submit(plugin, event)
+                else:
+                    plugin.process(event)
             else:
                 plugin.logger.debug("Skipping: inactive.")
 
@@ -691,8 +2172,12 @@ class PluginCollection(object):
         - Find all valid .py plugin files.
         - Loop on all plugin files.
         - For any new plugins, load them, otherwise, refresh them.
+
+        @return: The plugins found for the first time.
+        @rtype: I{list} of L{Plugin}
         """
         newPlugins = {}
+        discovered = []
 
         for basename in os.listdir(self.path):
             if not basename.endswith(".py") or basename.startswith("."):
@@ -704,10 +2189,12 @@ class PluginCollection(object):
                 newPlugins[basename] = Plugin(
                     self._engine, os.path.join(self.path, basename)
                 )
+                discovered.append(newPlugins[basename])
 
             newPlugins[basename].load()
 
         self._plugins = newPlugins
+        return discovered
 
     def __iter__(self):
         for basename in sorted(self._plugins.keys()):
@@ -720,68 +2207,132 @@ class Plugin(object):
     callbacks.
     """
 
-    def __init__(self, engine, path):
+    def __init__(self, engine, path, minConcurrency=1):
         """
         @param engine: The engine that instanciated this plugin.
         @type engine: L{Engine}
         @param path: The path of the plugin file to load.
         @type path: I{str}
+        @param minConcurrency: Minimum number of lanes of the plugin's
+            callbacks, see L{registerCallback}'s concurrency.
+        @type minConcurrency: I{int}
 
         @raise ValueError: If the path to the plugin is not a valid file.
         """
         self._engine = engine
         self._path = path
+        self._minConcurrency = minConcurrency
 
         if not os.path.isfile(path):
             raise ValueError("The path to the plugin is not a valid file - %s." % path)
 
         self._pluginName = os.path.splitext(os.path.split(self._path)[1])[0]
+        self._hosted = self._pluginName in self._engine.config.process_plugins
         self._active = True
         self._callbacks = []
+        self._routes = _RoutingTable([])
         self._mtime = None
         self._lastEventId = None
-        self._backlog = {}
+        self._lastDispatchedEventId = None
+        self._backlog = event_backlog.EventBacklog()
+
+        # Guards the event id bookkeeping which may be updated from a dispatch
+        # thread while the engine reads it.
+        self._lock = threading.RLock()
+
+        # Events handed to partitioned callbacks or waiting for their writes
+        # to be sent, in dispatch order. The last event id only moves past an
+        # event once it and every event before it are done.
+        self._partitioned = False
+        self._inflight = collections.OrderedDict()
+        self._inflightCondition = threading.Condition(self._lock)
+        self._maxInflight = max(1, self._engine.config.plugin_queue_size)
 
         # Setup the plugin's logger
         self.logger = logging.getLogger("plugin." + self.getName())
         self.logger.config = self._engine.config
         self._engine.setEmailsOnLogger(self.logger, True)
         self.logger.setLevel(self._engine.config.getLogLevel())
-        if self._engine.config.getLogMode() == 1:
-            _setFilePathOnLogger(
-                self.logger, self._engine.config.getLogFile("plugin." + self.getName())
-            )
+        self._engine.setLogFileOnLogger(self.logger, "plugin." + self.getName())
 
     def getName(self):
         return self._pluginName
 
     def setState(self, state):
-        if isinstance(state, int):
-            self._lastEventId = state
-        elif isinstance(state, tuple):
-            self._lastEventId, self._backlog = state
-        else:
-            raise ValueError("Unknown state type: %s." % type(state))
+        with self._lock:
+            if isinstance(state, int):
+                self._lastEventId = state
+            elif isinstance(state, tuple):
+                self._lastEventId = state[0]
+                self._backlog = event_backlog.EventBacklog(state[1])
+            else:
+                raise ValueError("Unknown state type: %s." % type(state))
 
     def getState(self):
-        return (self._lastEventId, self._backlog)
+        with self._lock:
+            return (self._lastEventId, self._backlog.getState())
+
+    def getLastEventId(self):
+        """
+        @return: The id of the last event the plugin is done with, I{None} if
+            it has no state yet.
+        @rtype: I{int}
+        """
+        with self._lock:
+            return self._lastEventId
 
     def getNextUnprocessedEventId(self):
-        if self._lastEventId:
-            nextId = self._lastEventId + 1
-        else:
-            nextId = None
+        with self._lock:
+            lastEventId = self._lastEventId
+            if self._lastDispatchedEventId is not None and (
+                lastEventId is None or self._lastDispatchedEventId > lastEventId
+            ):
+                # Events already queued for this plugin don't need fetching
+                # again.
+                lastEventId = self._lastDispatchedEventId
 
-        now = datetime.datetime.now()
-        for k in list(self._backlog):
-            v = self._backlog[k]
-            if v < now:
-                self.logger.warning("Timeout elapsed on backlog event id %d.", k)
-                del self._backlog[k]
-            elif nextId is None or k < nextId:
-                nextId = k
+            if lastEventId:
+                return lastEventId + 1
+            return None
 
-        return nextId
+    def getBacklogRanges(self):
+        """
+        Get the ids of the missing events the plugin is still waiting for.
+        Ids waited for longer than the backlog timeout are given up on.
+
+        @return: The (first, last) ranges of backlog event ids.
+        @rtype: I{list} of I{tuple}
+        """
+        with self._lock:
+            for start, end in self._backlog.expire(datetime.datetime.now()):
+                if start == end:
+                    self.logger.warning(
+                        "Timeout elapsed on backlog event id %d.", start
+                    )
+                else:
+                    self.logger.warning(
+                        "Timeout elapsed on backlog event ids %d-%d.", start, end
+                    )
+            return self._backlog.getRanges()
+
+    def isInBacklog(self, eventId):
+        with self._lock:
+            return eventId in self._backlog
+
+    def setDispatchedEventId(self, eventId):
+        """
+        Record the id of the last event queued for this plugin but not
+        necessarily processed yet.
+
+        @param eventId: The id of the queued event or I{None} when the queue
+            was dropped.
+        @type eventId: I{int} or L{None}
+        """
+        with self._lock:
+            if eventId is None or self._lastDispatchedEventId is None:
+                self._lastDispatchedEventId = eventId
+            else:
+                self._lastDispatchedEventId = max(self._lastDispatchedEventId, eventId)
 
     def isActive(self):
         """
@@ -792,6 +2343,34 @@ class Plugin(object):
         """
         return self._active
 
+    def getMatchingCallbacks(self, event):
+        """
+        Get the callbacks whose matchEvents match an event.
+
+        @param event: The Flow Production Tracking event to route.
+        @type event: I{dict}
+
+        @return: The matching callbacks in registration order.
+        @rtype: I{list} of L{Callback}
+        """
+        return self._routes.match(event)
+
+    def getShotgun(self, sgScriptName, sgScriptKey):
+        """
+        Get a connection to the Shotgun server, to validate the plugin's
+        settings in registerCallbacks for example.
+
+        @param sgScriptName: The name of the script to connect as.
+        @type sgScriptName: I{str}
+        @param sgScriptKey: The key of the script.
+        @type sgScriptKey: I{str}
+
+        @return: A connection shared with the callbacks using the same
+            script.
+        @rtype: L{shotgun_proxy.ShotgunProxy}
+        """
+        return self._engine.getShotgun(sgScriptName, sgScriptKey)
+
     def setEmails(self, *emails):
         """
         Set the email addresses to whom this plugin should send errors.
@@ -828,10 +2407,16 @@ class Plugin(object):
             # The mtime of file is equal or older. We don't need to do anything.
             return
 
+        # Let partitioned callbacks finish what they have been given before
+        # they are replaced.
+        self.drain()
+
         # Reset values
         self._mtime = mtime
         self._callbacks = []
+        self._routes = _RoutingTable([])
         self._active = True
+        self._partitioned = False
 
         try:
             plugin = imp.load_source(self._pluginName, self._path)
@@ -861,6 +2446,8 @@ class Plugin(object):
             )
             self._active = False
 
+        self._routes = _RoutingTable(self._callbacks)
+
     def registerCallback(
         self,
         sgScriptName,
@@ -869,108 +2456,704 @@ class Plugin(object):
         matchEvents=None,
         args=None,
         stopOnError=True,
+        concurrency=1,
+        partitionKey="entity",
+        entityFields=None,
+        batchWrites=False,
     ):
         """
         Register a callback in the plugin.
+
+        @param concurrency: Number of ordered lanes the callback's events are
+            spread on. Events with the same partition key always go to the
+            same lane and are processed in order, events on different lanes
+            are processed concurrently.
+        @type concurrency: I{int}
+        @param partitionKey: The event field whose value picks the lane of an
+            event, usually "entity" or "project", or a function taking an
+            event and returning a hashable key.
+        @type partitionKey: I{str} or a function object.
+        @param entityFields: Fields of the event's entity the callback needs.
+            They are fetched for a whole batch of events at once and added
+            to the event's "entity" dictionary, saving the callback a
+            find_one per event. Either a list of field names, or a dict of
+            entity type to list of field names.
+        @type entityFields: I{list} or I{dict}
+        @param batchWrites: Hold back the callback's creates, updates and
+            deletes and send them with batch calls, after each batch of
+            events or once write_batch_size of them are waiting. An event
+            only counts as processed once its writes are sent. The ids of
+            created entities are not known to the callback. Has no effect
+            for plugins running in worker processes.
+        @type batchWrites: I{bool}
+
+        The callback may be a coroutine function. It is then handed a
+        L{shotgun_proxy.AsyncShotgunProxy}, whose methods must be awaited,
+        e.g. C{await sg.find(...)}: they run the calls on the event loop's
+        executor, at most callback_concurrency_per_key at once for the script
+        key. The asyncio engine awaits the callback on its event loop, the
+        other engines run it to completion on an event loop of its own.
+        """
+        concurrency = max(concurrency, self._minConcurrency)
+
+        # Connections are borrowed from the engine's pool for each call, a
+        # handle per lane only keeps the lanes' session uuids and held back
+        # writes apart.
+        batchWrites = batchWrites and not self._hosted
+        if batchWrites:
+            sgConnections = [
+                self._engine.getBatchingShotgun(sgScriptName, sgScriptKey, self.logger)
+                for lane in range(max(1, concurrency))
+            ]
+        else:
+            sgConnections = [
+                self.getShotgun(sgScriptName, sgScriptKey)
+                for lane in range(max(1, concurrency))
+            ]
+        callbackObj = Callback(
+            callback,
+            self,
+            self._engine,
+            sgConnections[0],
+            matchEvents,
+            args,
+            stopOnError,
+            concurrency,
+            partitionKey,
+            sgConnections,
+            sgScriptKey,
+            entityFields,
+            batchWrites,
+        )
+        if self._hosted:
+            callbackObj.setHost(self._path, len(self._callbacks))
+        self._callbacks.append(callbackObj)
+        if callbackObj.isPartitioned() or callbackObj.isBatchingWrites():
+            self._partitioned = True
+
+    def process(self, event):
+        shouldProcess, inBacklog = self._checkEvent(event)
+        if shouldProcess:
+            if self._partitioned:
+                self._submit(event, inBacklog)
+            elif self._process(event):
+                with self._lock:
+                    self._completeEvent(event, inBacklog)
+
+        return self._active
+
+    async def processAsync(self, event):
+        """
+        Process an event from the asyncio engine's event loop.
+
+        @param event: The Flow Production Tracking event to process.
+        @type event: I{dict}
+
+        @return: True if the plugin is still active.
+        @rtype: I{bool}
+        """
+        if self._partitioned:
+            # Lanes run on their own threads, only handing the event over may
+            # block.
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self.process, event)
+
+        shouldProcess, inBacklog = self._checkEvent(event)
+        if shouldProcess and await self._processAsync(event):
+            with self._lock:
+                self._completeEvent(event, inBacklog)
+
+        return self._active
+
+    def _checkEvent(self, event):
+        """
+        Should an event be processed, and does it come from the backlog.
+        """
+        with self._lock:
+            inBacklog = event["id"] in self._backlog
+            inFlight = event["id"] in self._inflight
+            lastEventId = self._lastEventId
+
+        if inFlight:
+            self.logger.debug("Event %d is already being processed.", event["id"])
+            return False, inBacklog
+
+        if not inBacklog and lastEventId is not None and event["id"] <= lastEventId:
+            msg = "Event %d is too old. Last event processed was (%d)."
+            self.logger.debug(msg, event["id"], lastEventId)
+            return False, inBacklog
+
+        return True, inBacklog
+
+    def _completeEvent(self, event, fromBacklog):
+        if fromBacklog:
+            # The plugin already went past this id, only the hole is filled.
+            self.logger.info("Processed id %d from backlog." % event["id"])
+            self._backlog.discard(event["id"])
+        else:
+            self._updateLastEventId(event)
+
+    def _submit(self, event, fromBacklog):
+        """
+        Hand an event to the plugin's callbacks without waiting for the
+        partitioned ones to be done with it.
+        """
+        flush = True
+        while True:
+            with self._lock:
+                if len(self._inflight) < self._maxInflight or not self._active:
+                    break
+            if not self._engine._continue:
+                # Left for the next start to fetch again.
+                return
+
+            if flush:
+                # Events may only be waiting for their writes, which the
+                # lanes may hold back after any given flush.
+                self.flushWrites()
+            with self._lock:
+                flush = (
+                    len(self._inflight) >= self._maxInflight
+                    and self._active
+                    and not self._inflightCondition.wait(1)
+                )
+
+        with self._lock:
+            entry = _InflightEvent(event, fromBacklog)
+            self._inflight[event["id"]] = entry
+            self.setDispatchedEventId(event["id"])
+
+        for callback in self.getMatchingCallbacks(event):
+            if not callback.isActive():
+                msg = "Skipping inactive callback %s in plugin."
+                self.logger.debug(msg, str(callback))
+                continue
+
+            msg = "Dispatching event %d to callback %s."
+            self.logger.debug(msg, event["id"], str(callback))
+            if callback.isPartitioned() or callback.isBatchingWrites():
+                with self._lock:
+                    entry.pending += 1
+                future = callback.submit(event)
+                future.add_done_callback(functools.partial(self._laneDone, entry))
+                if future.done() and not future.result():
+                    break
+            elif not callback.process(event):
+                # A callback in the plugin failed. Deactivate the whole
+                # plugin.
+                with self._lock:
+                    entry.failed = True
+                    self._active = False
+                break
+
+        with self._lock:
+            # Release the hold taken when the entry was created.
+            entry.pending -= 1
+            self._advanceInflight()
+
+    def _laneDone(self, entry, future):
+        if future.cancelled():
+            success = False
+        else:
+            success = future.exception() is None and future.result()
+
+        with self._lock:
+            entry.pending -= 1
+            if not success:
+                entry.failed = True
+                if not future.cancelled():
+                    # A callback in the plugin failed. Deactivate the whole
+                    # plugin.
+                    self._active = False
+            self._advanceInflight()
+
+    def _advanceInflight(self):
+        while self._inflight:
+            entry = next(iter(self._inflight.values()))
+            if entry.pending or entry.failed:
+                break
+            del self._inflight[entry.event["id"]]
+            self._completeEvent(entry.event, entry.fromBacklog)
+        self._inflightCondition.notify_all()
+
+    def drain(self, cancel=False):
+        """
+        Wait for the partitioned callbacks to be done with their events and
+        stop their lanes.
+
+        @param cancel: If I{True}, events waiting on a lane are dropped
+            instead of processed. They will be fetched again on next start.
+        @type cancel: I{bool}
+        """
+        for callback in self._callbacks:
+            callback.stopLanes(cancel)
+        self.flushWrites()
+
+        with self._lock:
+            if self._inflight:
+                # Whatever is left failed or was dropped, fetch it again.
+                self._inflight.clear()
+                self._lastDispatchedEventId = None
+            self._inflightCondition.notify_all()
+
+    def flushWrites(self):
+        """
+        Send the writes held back by the plugin's callbacks.
+        """
+        for callback in self._callbacks:
+            callback.flushWrites()
+
+    def _process(self, event):
+        for callback in self.getMatchingCallbacks(event):
+            if callback.isActive():
+                msg = "Dispatching event %d to callback %s."
+                self.logger.debug(msg, event["id"], str(callback))
+                if not callback.process(event):
+                    # A callback in the plugin failed. Deactivate the whole
+                    # plugin.
+                    self._active = False
+                    break
+            else:
+                msg = "Skipping inactive callback %s in plugin."
+                self.logger.debug(msg, str(callback))
+
+        return self._active
+
+    async def _processAsync(self, event):
+        for callback in self.getMatchingCallbacks(event):
+            if callback.isActive():
+                msg = "Dispatching event %d to callback %s."
+                self.logger.debug(msg, event["id"], str(callback))
+                if not await callback.processAsync(event):
+                    # A callback in the plugin failed. Deactivate the whole
+                    # plugin.
+                    self._active = False
+                    break
+            else:
+                msg = "Skipping inactive callback %s in plugin."
+                self.logger.debug(msg, str(callback))
+
+        return self._active
+
+    def _updateLastEventId(self, event):
+        BACKLOG_TIMEOUT = (
+            5  # time in minutes after which we consider a pending event won't happen
+        )
+        if self._lastEventId is not None and event["id"] > self._lastEventId + 1:
+            event_date = event["created_at"].replace(tzinfo=None)
+            if datetime.datetime.now() > (
+                event_date + datetime.timedelta(minutes=BACKLOG_TIMEOUT)
+            ):
+                # the event we've just processed happened more than BACKLOG_TIMEOUT minutes ago so any event
+                # with a lower id should have shown up in the EventLog by now if it actually happened
+                if event["id"] == self._lastEventId + 2:
+                    self.logger.info(
+                        "Event %d never happened - ignoring.", self._lastEventId + 1
+                    )
+                else:
+                    self.logger.info(
+                        "Events %d-%d never happened - ignoring.",
+                        self._lastEventId + 1,
+                        event["id"] - 1,
+                    )
+            else:
+                # in this case, we want to add the missing events to the backlog as they could show up in the
+                # EventLog within BACKLOG_TIMEOUT minutes, during which we'll keep asking for the same range
+                # them to show up until they expire
+                expiration = datetime.datetime.now() + datetime.timedelta(
+                    minutes=BACKLOG_TIMEOUT
+                )
+                firstId, lastId = self._lastEventId + 1, event["id"] - 1
+                if firstId == lastId:
+                    self.logger.info("Adding event id %d to backlog.", firstId)
+                else:
+                    self.logger.info(
+                        "Adding event ids %d-%d to backlog.", firstId, lastId
+                    )
+                self._backlog.add(firstId, lastId, expiration)
+        self._lastEventId = event["id"]
+
+    def __iter__(self):
+        """
+        A plugin is iterable and will iterate over all its L{Callback} objects.
+        """
+        return self._callbacks.__iter__()
+
+    def __str__(self):
+        """
+        Provide the name of the plugin when it is cast as string.
+
+        @return: The name of the plugin.
+        @rtype: I{str}
+        """
+        return self.getName()
+
+
+class _InflightEvent(object):
+    """
+    An event handed to partitioned callbacks which they may still be working
+    on.
+    """
+
+    def __init__(self, event, fromBacklog):
+        self.event = event
+        self.fromBacklog = fromBacklog
+        # Number of callbacks still working on the event. Starts at one so the
+        # event can't complete before all callbacks have been handed the event.
+        self.pending = 1
+        self.failed = False
+
+
+class _PollInterval(object):
+    """
+    How long to wait between two polls for events.
+
+    The interval is halved down to a minimum every time a poll gets events,
+    so events following each other are picked up quickly, and grows back up
+    to a maximum while polls come back empty.
+
+    The engine and its prefetcher both wait on the same interval, it is safe
+    to use from several threads.
+    """
+
+    GROWTH = 1.5
+
+    def __init__(self, minInterval, maxInterval):
+        """
+        @param minInterval: Minimum number of seconds between two polls.
+        @type minInterval: I{float}
+        @param maxInterval: Maximum number of seconds between two polls.
+        @type maxInterval: I{float}
+        """
+        self._min = min(minInterval, maxInterval)
+        self._max = maxInterval
+        self._interval = self._min
+        self._lock = threading.Lock()
+
+    def get(self):
+        """
+        @return: Number of seconds to wait before the next poll.
+        @rtype: I{float}
+        """
+        with self._lock:
+            return self._interval
+
+    def update(self, eventCount):
+        """
+        @param eventCount: Number of events the last poll got.
+        @type eventCount: I{int}
+
+        @return: Number of seconds to wait before the next poll.
+        @rtype: I{float}
+        """
+        with self._lock:
+            if eventCount:
+                self._interval = max(self._min, self._interval / 2)
+            else:
+                self._interval = min(self._max, self._interval * self.GROWTH)
+            return self._interval
+
+
+class _BatchSize(object):
+    """
+    How many events to fetch at once.
+
+    Batches are sized to take about a target time to process, from the
+    average time events took so far, so a slow callback doesn't hold the
+    next checkpoint back for minutes. The size stays under the configured
+    batch size while the engine keeps up, and can grow up to a larger
+    maximum while it is far behind the event log.
+
+    A batch is timed from when it is dispatched, or when the batch before it
+    was done if that is later, until every plugin of the lane processed it,
+    whether plugins process their events inline or on other threads.
+
+    The prefetcher sizes and fetches the batches of the fast lane while the
+    engine dispatches them, it is safe to use from several threads.
+    """
+
+    MIN_SIZE = 10
+    SMOOTHING = 0.2
+
+    def __init__(self, size, maxSize, targetTime):
+        """
+        @param size: Maximum number of events to fetch at once while keeping
+            up, see L{Config.getMaxEventBatchSize}.
+        @type size: I{int}
+        @param maxSize: Maximum number of events to fetch at once while
+            behind.
+        @type maxSize: I{int}
+        @param targetTime: Number of seconds a batch should take to process,
+            0 to always fetch size events.
+        @type targetTime: I{float}
+        """
+        self._default = size
+        self._max = max(size, maxSize)
+        self._min = min(size, self.MIN_SIZE)
+        self._target = targetTime
+        self._cost = None
+        self._size = size
+        self._behind = False
+        self._lock = threading.Lock()
+        # The last event id, number of events and dispatch time of the
+        # batches not done yet.
+        self._pending = collections.deque()
+        self._lastDone = None
+
+    def get(self, lag):
+        """
+        @param lag: Number of events left in the event log, I{None} if it
+            isn't known.
+        @type lag: I{int}
+
+        @return: The number of events to fetch next.
+        @rtype: I{int}
+        """
+        if lag is None or lag <= self._default:
+            ceiling = self._default
+        else:
+            ceiling = min(self._max, lag)
+
+        with self._lock:
+            if not self._target or self._cost is None:
+                size = self._default
+            elif self._cost <= 0:
+                size = ceiling
+            else:
+                size = int(self._target / self._cost)
+
+            self._size = max(self._min, min(ceiling, size))
+            return self._size
+
+    def fetched(self, eventCount, more=False):
+        """
+        @param eventCount: Number of events the last fetch got.
+        @type eventCount: I{int}
+        @param more: True if more events are known to be waiting, whatever
+            the number fetched.
+        @type more: I{bool}
+        """
+        with self._lock:
+            self._behind = more or eventCount >= self._size
+
+    def dispatched(self, events):
+        """
+        @param events: The events of a batch about to be dispatched, in id
+            order.
+        @type events: I{list}
+        """
+        if events:
+            with self._lock:
+                self._pending.append((events[-1]["id"], len(events), time.monotonic()))
+
+    def completed(self, lastEventId):
+        """
+        Time the batches the plugins of the lane are done with.
+
+        @param lastEventId: The id of the last event every plugin of the
+            lane processed, I{None} if the lane has no plugins left.
+        @type lastEventId: I{int}
+        """
+        now = time.monotonic()
+        with self._lock:
+            if lastEventId is None:
+                self._pending.clear()
+                self._lastDone = None
+                return
+
+            while self._pending and self._pending[0][0] <= lastEventId:
+                batchLastId, eventCount, dispatchTime = self._pending.popleft()
+                if self._lastDone is not None:
+                    dispatchTime = max(dispatchTime, self._lastDone)
+                self._lastDone = now
+                cost = (now - dispatchTime) / eventCount
+                if self._cost is None:
+                    self._cost = cost
+                else:
+                    self._cost += self.SMOOTHING * (cost - self._cost)
+
+    def isBehind(self):
+        """
+        @return: True if the last fetch got a full batch, so more events are
+            waiting.
+        @rtype: I{bool}
+        """
+        with self._lock:
+            return self._behind
+
+    def getCost(self):
+        """
+        @return: The average number of seconds an event takes to process.
+        @rtype: I{float}
         """
-        global sg
-        sgConnection = sg.Shotgun(
-            self._engine.config.getShotgunURL(),
-            sgScriptName,
-            sgScriptKey,
-            http_proxy=self._engine.config.getEngineProxyServer(),
-        )
-        self._callbacks.append(
-            Callback(
-                callback,
-                self,
-                self._engine,
-                sgConnection,
-                matchEvents,
-                args,
-                stopOnError,
-            )
-        )
+        with self._lock:
+            return self._cost or 0.0
 
-    def process(self, event):
-        if event["id"] in self._backlog:
-            if self._process(event):
-                self.logger.info("Processed id %d from backlog." % event["id"])
-                del self._backlog[event["id"]]
-                self._updateLastEventId(event)
-        elif self._lastEventId is not None and event["id"] <= self._lastEventId:
-            msg = "Event %d is too old. Last event processed was (%d)."
-            self.logger.debug(msg, event["id"], self._lastEventId)
-        else:
-            if self._process(event):
-                self._updateLastEventId(event)
 
-        return self._active
+class _RangeFetcher(object):
+    """
+    Fetch the events of a lane far behind the head of the event log as
+    consecutive windows of ids, several at once over as many connections,
+    and hand them out in order.
 
-    def _process(self, event):
-        for callback in self:
-            if callback.isActive():
-                if callback.canProcess(event):
-                    msg = "Dispatching event %d to callback %s."
-                    self.logger.debug(msg, event["id"], str(callback))
-                    if not callback.process(event):
-                        # A callback in the plugin failed. Deactivate the whole
-                        # plugin.
-                        self._active = False
-                        break
-            else:
-                msg = "Skipping inactive callback %s in plugin."
-                self.logger.debug(msg, str(callback))
+    A window is only fetched ahead when there is a free connection for it,
+    so the events held waiting for an earlier window to be done are
+    bounded by the number of connections times the window size.
+    """
 
-        return self._active
+    def __init__(self, engine, connections):
+        """
+        @param engine: The engine the events are fetched for.
+        @type engine: L{Engine}
+        @param connections: Number of windows fetched at once, 1 or less
+            to fetch one batch after the other.
+        @type connections: I{int}
+        """
+        self._engine = engine
+        self._connections = connections
+        self._executor = None
+        self._windows = collections.deque()
+        self._nextStart = None
+        # The cursors the engine may ask for next without losing the windows
+        # fetched ahead: from after the last event handed out to the end of
+        # its window.
+        self._expected = None
+
+    def isEnabled(self):
+        return self._connections > 1
+
+    def getEvents(self, sgConnection, nextEventId, headEventId, windowSize):
+        """
+        Get the events of the next window which has any.
+
+        @param sgConnection: The connection to fetch the events with, it
+            must be safe to use from several threads.
+        @type sgConnection: L{shotgun_proxy.ShotgunProxy}
+        @param nextEventId: The id of the next event the lane needs.
+        @type nextEventId: I{int}
+        @param headEventId: The id of the last event to fetch windows up to.
+        @type headEventId: I{int}
+        @param windowSize: Number of ids in a window.
+        @type windowSize: I{int}
+
+        @return: The events, in id order, I{None} once the windows reached
+            headEventId.
+        @rtype: I{list} of Flow Production Tracking event dictionaries.
+        """
+        if self._expected is None or not (
+            self._expected[0] <= nextEventId <= self._expected[1]
+        ):
+            # Plugins were loaded or reloaded since, start over from where
+            # they are.
+            self.reset()
+            self._nextStart = nextEventId
+
+        if self._executor is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=self._connections, thread_name_prefix="RangeFetcher"
+            )
 
-    def _updateLastEventId(self, event):
-        BACKLOG_TIMEOUT = (
-            5  # time in minutes after which we consider a pending event won't happen
-        )
-        if self._lastEventId is not None and event["id"] > self._lastEventId + 1:
-            event_date = event["created_at"].replace(tzinfo=None)
-            if datetime.datetime.now() > (
-                event_date + datetime.timedelta(minutes=BACKLOG_TIMEOUT)
+        while True:
+            while len(self._windows) < self._connections and (
+                self._nextStart <= headEventId
             ):
-                # the event we've just processed happened more than BACKLOG_TIMEOUT minutes ago so any event
-                # with a lower id should have shown up in the EventLog by now if it actually happened
-                if event["id"] == self._lastEventId + 2:
-                    self.logger.info(
-                        "Event %d never happened - ignoring.", self._lastEventId + 1
-                    )
-                else:
-                    self.logger.info(
-                        "Events %d-%d never happened - ignoring.",
-                        self._lastEventId + 1,
-                        event["id"] - 1,
-                    )
-            else:
-                # in this case, we want to add the missing events to the backlog as they could show up in the
-                # EventLog within BACKLOG_TIMEOUT minutes, during which we'll keep asking for the same range
-                # them to show up until they expire
-                expiration = datetime.datetime.now() + datetime.timedelta(
-                    minutes=BACKLOG_TIMEOUT
+                end = min(self._nextStart + windowSize - 1, headEventId)
+                future = self._executor.submit(
+                    self._engine._findEvents,
+                    sgConnection,
+                    [["id", "between", [self._nextStart, end]]],
+                    end - self._nextStart + 1,
                 )
-                for skippedId in range(self._lastEventId + 1, event["id"]):
-                    self.logger.info("Adding event id %d to backlog.", skippedId)
-                    self._backlog[skippedId] = expiration
-        self._lastEventId = event["id"]
+                self._windows.append((end, future))
+                self._nextStart = end + 1
 
-    def __iter__(self):
+            if not self._windows:
+                self._expected = None
+                return None
+
+            end, future = self._windows.popleft()
+            events = future.result()
+            if events:
+                self._expected = (events[-1]["id"] + 1, end + 1)
+                return events
+            if not self._engine._continue:
+                return []
+
+    def reset(self):
         """
-        A plugin is iterable and will iterate over all its L{Callback} objects.
+        Drop the windows fetched ahead.
         """
-        return self._callbacks.__iter__()
+        for end, future in self._windows:
+            future.cancel()
+        self._windows.clear()
+        self._expected = None
 
-    def __str__(self):
+    def shutdown(self):
+        self.reset()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+
+class _RoutingTable(object):
+    """
+    Index of a plugin's callbacks by the event types and attribute names
+    their matchEvents filters accept, built when the plugin is loaded.
+
+    Looking up an event costs two dict lookups whatever the number of
+    callbacks, and events no callback wants resolve to an empty list.
+    """
+
+    # Stand-ins for event types and attribute names no filter names.
+    _OTHER_TYPE = "\0other_type"
+    _OTHER_ATTRIBUTE = "\0other_attribute"
+
+    def __init__(self, callbacks):
         """
-        Provide the name of the plugin when it is cast as string.
+        @param callbacks: The callbacks of the plugin, in registration order.
+        @type callbacks: I{list} of L{Callback}
+        """
+        self._callbacks = list(callbacks)
+        eventTypes = set()
+        attributeNames = set()
+        for callback in callbacks:
+            matchEvents = callback.getMatchEvents() or {}
+            for eventType, attributes in matchEvents.items():
+                eventTypes.add(eventType)
+                if isinstance(attributes, str):
+                    attributeNames.add(attributes)
+                elif attributes is not None:
+                    attributeNames.update(a for a in attributes if a)
+
+        # Resolve every combination with Callback.canProcess itself so the
+        # table can't disagree with it.
+        self._table = {}
+        for eventType in eventTypes | set([self._OTHER_TYPE]):
+            routes = {}
+            for attributeName in attributeNames | set([self._OTHER_ATTRIBUTE]):
+                probe = {"event_type": eventType, "attribute_name": attributeName}
+                routes[attributeName] = [c for c in callbacks if c.canProcess(probe)]
+            self._table[eventType] = (routes, routes.pop(self._OTHER_ATTRIBUTE))
+
+    def getCallbacks(self):
+        return self._callbacks
+
+    def match(self, event):
+        """
+        @param event: The Flow Production Tracking event to route.
+        @type event: I{dict}
 
-        @return: The name of the plugin.
-        @rtype: I{str}
+        @return: The callbacks matching the event, in registration order.
+        @rtype: I{list} of L{Callback}
         """
-        return self.getName()
+        if event["event_type"] is None:
+            # A stub standing for an event that was filtered out when
+            # fetching, see Engine._fetchFilteredEvents.
+            return []
+        routes, default = self._table.get(
+            event["event_type"], self._table[self._OTHER_TYPE]
+        )
+        return routes.get(event["attribute_name"], default)
 
 
 class Registrar(object):
@@ -983,7 +3166,7 @@ class Registrar(object):
         Wrap a plugin so it can be passed to a user.
         """
         self._plugin = plugin
-        self._allowed = ["logger", "setEmails", "registerCallback"]
+        self._allowed = ["logger", "setEmails", "registerCallback", "getShotgun"]
 
     def getLogger(self):
         """
@@ -1017,6 +3200,12 @@ class Callback(object):
         matchEvents=None,
         args=None,
         stopOnError=True,
+        concurrency=1,
+        partitionKey="entity",
+        laneShotguns=None,
+        scriptKey=None,
+        entityFields=None,
+        batchWrites=False,
     ):
         """
         @param callback: The function to run when a Flow Production Tracking event occurs.
@@ -1031,14 +3220,60 @@ class Callback(object):
         @param args: Any datastructure you would like to be passed to your
             callback function. Defaults to None.
         @type args: Any object.
+        @param concurrency: Number of ordered lanes events are spread on.
+        @type concurrency: I{int}
+        @param partitionKey: The event field or function picking the lane of
+            an event.
+        @type partitionKey: I{str} or a function object.
+        @param laneShotguns: One Shotgun instance per lane. Defaults to
+            shotgun for every lane.
+        @type laneShotguns: I{list} of L{sg.Shotgun}
+        @param scriptKey: The script key the callback connects with, the
+            asyncio engine bounds how many callbacks run at once per key.
+        @type scriptKey: I{str}
+        @param entityFields: The entity fields to add to the events, for any
+            entity type or per entity type.
+        @type entityFields: I{list} or I{dict}
+        @param batchWrites: Whether the Shotgun instances hold back their
+            writes, in which case they must be
+            L{shotgun_proxy.BatchingShotgunProxy} instances.
+        @type batchWrites: I{bool}
 
         @raise TypeError: If the callback is not a callable object.
+        @raise ValueError: If matchEvents, concurrency, partitionKey or
+            entityFields are not valid.
         """
         if not callable(callback):
             raise TypeError(
                 "The callback must be a callable object (function, method or callable class instance)."
             )
 
+        if not isinstance(concurrency, int) or concurrency < 1:
+            raise ValueError(
+                "The concurrency of a callback must be a positive integer. Got %r."
+                % (concurrency,)
+            )
+
+        if matchEvents is not None and not isinstance(matchEvents, dict):
+            raise ValueError(
+                "matchEvents should be a dict of event types to attribute names. Got %s."
+                % type(matchEvents)
+            )
+
+        if entityFields is not None and not isinstance(
+            entityFields, (list, tuple, dict)
+        ):
+            raise ValueError(
+                "entityFields should be a list of field names or a dict of entity types to field names. Got %s."
+                % type(entityFields)
+            )
+
+        if not (callable(partitionKey) or isinstance(partitionKey, str)):
+            raise ValueError(
+                "partitionKey should be an event field name or a function. Got %s."
+                % type(partitionKey)
+            )
+
         self._name = None
         self._shotgun = shotgun
         self._callback = callback
@@ -1048,6 +3283,23 @@ class Callback(object):
         self._args = args
         self._stopOnError = stopOnError
         self._active = True
+        self._isCoroutine = inspect.iscoroutinefunction(
+            callback
+        ) or inspect.iscoroutinefunction(getattr(callback, "__call__", None))
+        self._partitionKey = partitionKey
+        self._scriptKey = scriptKey
+        self._entityFields = entityFields
+        self._batchWrites = batchWrites
+        self._hostPath = None
+        self._hostIndex = None
+        self._lanes = []
+        self._laneShotguns = laneShotguns or [shotgun] * concurrency
+        if concurrency > 1:
+            # A single worker per lane keeps the events of a lane in order.
+            self._lanes = [
+                concurrent.futures.ThreadPoolExecutor(max_workers=1)
+                for lane in range(concurrency)
+            ]
 
         # Find a name for this object
         if hasattr(callback, "__name__"):
@@ -1084,7 +3336,140 @@ class Callback(object):
 
         return False
 
-    def process(self, event):
+    def setHost(self, pluginPath, index):
+        """
+        Run this callback in the engine's worker processes.
+
+        @param pluginPath: The path of the plugin the callback belongs to.
+        @type pluginPath: I{str}
+        @param index: The position of the callback in the plugin's
+            registration order.
+        @type index: I{int}
+        """
+        self._hostPath = pluginPath
+        self._hostIndex = index
+
+    def getScriptKey(self):
+        return self._scriptKey
+
+    def getMatchEvents(self):
+        return self._matchEvents
+
+    def getEntityFields(self, entityType=None):
+        """
+        Get the entity fields the callback needs.
+
+        @param entityType: The type of the event's entity. If I{None}, tells
+            whether any field was asked for.
+        @type entityType: I{str}
+
+        @return: The field names.
+        @rtype: I{list}
+        """
+        if isinstance(self._entityFields, dict):
+            if entityType is None:
+                return [f for fields in self._entityFields.values() for f in fields]
+            return self._entityFields.get(entityType, [])
+        return self._entityFields or []
+
+    def isBatchingWrites(self):
+        """
+        @return: True if the callback's writes are held back, and its events
+            are only done once they are sent.
+        @rtype: I{bool}
+        """
+        return self._batchWrites
+
+    def isPartitioned(self):
+        """
+        Are this callback's events spread on several lanes.
+
+        @return: True if events are processed through L{submit}.
+        @rtype: I{bool}
+        """
+        return bool(self._lanes)
+
+    def getPartitionKey(self, event):
+        """
+        Get the value deciding on which lane an event is processed.
+
+        @param event: The Flow Production Tracking event to process.
+        @type event: I{dict}
+
+        @return: A hashable value, events with equal keys share a lane.
+        """
+        if callable(self._partitionKey):
+            return self._partitionKey(event)
+
+        value = event.get(self._partitionKey)
+        if isinstance(value, dict):
+            return (value.get("type"), value.get("id"))
+        return value
+
+    def submit(self, event):
+        """
+        Queue an event on the lane matching its partition key. Without lanes,
+        the event is processed right away.
+
+        @param event: The Flow Production Tracking event to process.
+        @type event: I{dict}
+
+        @return: A future resolving to the result of L{process}, once the
+            writes held back while processing the event are sent.
+        @rtype: L{concurrent.futures.Future}
+        """
+        if not self._lanes:
+            return self._processWrites(event, self._shotgun)
+
+        try:
+            lane = hash(self.getPartitionKey(event)) % len(self._lanes)
+        except:
+            # Without a lane the event can't be processed, fail it like the
+            # callback would have.
+            self._logError(traceback.format_exc(), self._getPluginLocals())
+            self._active = False
+            future = concurrent.futures.Future()
+            future.set_result(False)
+            return future
+
+        shotgun = self._laneShotguns[lane]
+        if not self._batchWrites:
+            return self._lanes[lane].submit(self.process, event, shotgun)
+
+        future = concurrent.futures.Future()
+        laneFuture = self._lanes[lane].submit(self._processWrites, event, shotgun)
+        laneFuture.add_done_callback(functools.partial(_chainWrites, future))
+        return future
+
+    def _processWrites(self, event, shotgun):
+        success = self.process(event, shotgun)
+        writes = shotgun.mark()
+        if writes is None or not success:
+            # The writes are still sent, as they would have been without
+            # holding them back.
+            writes = concurrent.futures.Future()
+            writes.set_result(success)
+        return writes
+
+    def flushWrites(self):
+        """
+        Send the writes held back by the callback's Shotgun instances.
+        """
+        if self._batchWrites:
+            for shotgun in self._laneShotguns:
+                shotgun.flush()
+
+    def stopLanes(self, cancel=False):
+        """
+        Wait for the events queued on the lanes to be processed.
+
+        @param cancel: If I{True}, events not started yet are dropped.
+        @type cancel: I{bool}
+        """
+        for lane in self._lanes:
+            lane.shutdown(wait=True, cancel_futures=cancel)
+
+    def process(self, event, shotgun=None):
         """
         Process an event with the callback object supplied on initialization.
 
@@ -1093,34 +3478,110 @@ class Callback(object):
 
         @param event: The Flow Production Tracking event to process.
         @type event: I{dict}
+        @param shotgun: The Shotgun instance to hand to the callback. Defaults
+            to the one supplied on initialization.
+        @type shotgun: L{sg.Shotgun}
         """
-        # set session_uuid for UI updates
-        if self._engine._use_session_uuid:
-            self._shotgun.set_session_uuid(event["session_uuid"])
+        if shotgun is None:
+            shotgun = self._shotgun
 
-        if self._engine.timing_logger:
-            start_time = datetime.datetime.now(SG_TIMEZONE.local)
+        start_time = self._startProcessing(event, shotgun)
+
+        try:
+            if self._hostPath is not None:
+                self._engine._pluginHost.run(
+                    self, self._hostPath, self._hostIndex, self._logger, event
+                )
+            elif self._isCoroutine:
+                # Outside of the asyncio engine, coroutine callbacks run to
+                # completion on an event loop of their own.
+                asyncio.run(self._awaitCallback(shotgun, event))
+            else:
+                self._callback(shotgun, self._logger, event, self._args)
+            error = False
+        except plugin_host.PluginHostError as err:
+            error = True
+            self._logError(err.trace, err.localVars)
+        except:
+            error = True
+            self._logError(traceback.format_exc(), self._getPluginLocals())
+
+        self._endProcessing(event, start_time, error)
+
+        return self._active
+
+    async def processAsync(self, event):
+        """
+        Process an event from the asyncio engine's event loop.
+
+        Coroutine callbacks are awaited directly, with an
+        L{shotgun_proxy.AsyncShotgunProxy} running their Shotgun calls on the
+        event loop's executor. Other callbacks are run on the executor. Either
+        way the calls or callbacks running at once for the script key are
+        bounded by its semaphore.
+
+        @param event: The Flow Production Tracking event to process.
+        @type event: I{dict}
+        """
+        semaphore = self._engine.getScriptSemaphore(self._scriptKey)
+        if self._hostPath is not None or not self._isCoroutine:
+            loop = asyncio.get_running_loop()
+            async with semaphore:
+                return await loop.run_in_executor(None, self.process, event)
+
+        start_time = self._startProcessing(event, self._shotgun)
 
         try:
-            self._callback(self._shotgun, self._logger, event, self._args)
+            await self._awaitCallback(self._shotgun, event, semaphore)
             error = False
         except:
             error = True
+            self._logError(traceback.format_exc(), self._getPluginLocals())
+
+        self._endProcessing(event, start_time, error)
 
-            # Get the local variables of the frame of our plugin
-            tb = sys.exc_info()[2]
-            stack = []
-            while tb:
-                stack.append(tb.tb_frame)
-                tb = tb.tb_next
+        return self._active
 
-            msg = "An error occured processing an event.\n\n%s\n\nLocal variables at outer most frame in plugin:\n\n%s"
-            self._logger.critical(
-                msg, traceback.format_exc(), pprint.pformat(stack[1].f_locals)
+    async def _awaitCallback(self, shotgun, event, semaphore=None):
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(
+                max(1, self._engine.config.callback_concurrency_per_key)
             )
-            if self._stopOnError:
-                self._active = False
+        shotgun = shotgun_proxy.AsyncShotgunProxy(shotgun, semaphore)
+        await self._callback(shotgun, self._logger, event, self._args)
 
+    def _startProcessing(self, event, shotgun):
+        # set session_uuid for UI updates
+        if self._engine._use_session_uuid and self._hostPath is None:
+            shotgun.set_session_uuid(event["session_uuid"])
+
+        if self._engine.timing_logger:
+            return datetime.datetime.now(SG_TIMEZONE.local)
+        return None
+
+    def _getPluginLocals(self):
+        # Get the local variables of the frame of our plugin, skipping our own
+        # frames and the asyncio machinery running coroutine callbacks.
+        tb = sys.exc_info()[2]
+        stack = []
+        while tb:
+            stack.append(tb.tb_frame)
+            tb = tb.tb_next
+
+        for frame in stack[1:]:
+            if frame.f_code is Callback._awaitCallback.__code__:
+                continue
+            if not frame.f_globals.get("__name__", "").startswith("asyncio"):
+                return pprint.pformat(frame.f_locals)
+        return ""
+
+    def _logError(self, trace, localVars):
+        msg = "An error occured processing an event.\n\n%s\n\nLocal variables at outer most frame in plugin:\n\n%s"
+        self._logger.critical(msg, trace, localVars)
+        if self._stopOnError:
+            self._active = False
+
+    def _endProcessing(self, event, start_time, error):
         if self._engine.timing_logger:
             callback_name = self._logger.name.replace("plugin.", "")
             end_time = datetime.datetime.now(SG_TIMEZONE.local)
@@ -1139,8 +3600,6 @@ class Callback(object):
             ]
             self._engine.timing_logger.info(msg_format, *data)
 
-        return self._active
-
     def _prettyTimeDeltaFormat(self, time_delta):
         days, remainder = divmod(time_delta.total_seconds(), 86400)
         hours, remainder = divmod(remainder, 3600)
@@ -1173,6 +3632,20 @@ class Callback(object):
         return self._name
 
 
+def _chainWrites(future, laneFuture):
+    """
+    Resolve a future with the result of the writes future a lane returned.
+    """
+    if laneFuture.cancelled():
+        future.cancel()
+    elif laneFuture.exception() is not None:
+        future.set_exception(laneFuture.exception())
+    else:
+        laneFuture.result().add_done_callback(
+            lambda writes: future.set_result(writes.result())
+        )
+
+
 class CustomSMTPHandler(logging.handlers.SMTPHandler):
     """
     A custom SMTPHandler subclass that will adapt it's subject depending on the
@@ -1266,7 +3739,7 @@ if sys.platform == "win32":
         def __init__(self, args):
             win32serviceutil.ServiceFramework.__init__(self, args)
             self.hWaitStop = win32event.CreateEvent(None, 0, 0, None)
-            self._engine = Engine(_getConfigPath())
+            self._engine = _createEngine(_getConfigPath())
 
         def SvcStop(self):
             """
@@ -1300,7 +3773,7 @@ class LinuxDaemon(daemonizer.Daemon):
     """
 
     def __init__(self):
-        self._engine = Engine(_getConfigPath())
+        self._engine = _createEngine(_getConfigPath())
         super(LinuxDaemon, self).__init__(
             "shotgunEvent", self._engine.config.getEnginePIDFile()
         )
@@ -1320,12 +3793,381 @@ class LinuxDaemon(daemonizer.Daemon):
         """
         Start the engine's main loop
         """
+        if hasattr(signal, "SIGHUP"):
+            # Send SIGHUP to pick up plugin changes right away.
+            signal.signal(signal.SIGHUP, lambda signum, frame: self._engine.wakeUp())
         self._engine.start()
 
     def _cleanup(self):
         self._engine.stop()
 
 
+class _ReplayEngine(Engine):
+    """
+    The engine of a L{Replay}, with the daemon's config and connections but
+    none of its files. The event id file isn't opened, the event archive is
+    only read, and logs go to the console rather than to the daemon's log
+    files and emails.
+    """
+
+    def _openCheckpoint(self):
+        return None
+
+    def _openArchive(self):
+        path = self.config.getEventArchiveDir()
+        if not path or not os.path.isdir(path):
+            return None
+        return event_archive.EventArchive(path, readOnly=True)
+
+    def _setUpLoggers(self):
+        self.log = logging.getLogger("replay")
+        self.log.setLevel(self.config.getLogLevel())
+        self.timing_logger = None
+
+    def setLogFileOnLogger(self, logger, name):
+        pass
+
+    def setEmailsOnLogger(self, logger, emails):
+        # Failures are reported on the console the replay runs from.
+        _removeHandlersFromLogger(logger, logging.handlers.SMTPHandler)
+
+
+class Replay(object):
+    """
+    Run a single plugin over a range of past events, to backfill or debug it,
+    apart from the live daemon.
+
+    The plugin is loaded and the events dispatched to it with the same
+    L{Plugin} and L{Callback} machinery as the daemon's, but its state is
+    never saved so the daemon's event id file is left alone. Events are read
+    from the event archive or fetched from Shotgun, a few batches ahead of
+    the plugin, on a thread of their own.
+
+    The archive only holds the events the daemon fetched in full, those the
+    live plugins wanted when server side filters or lean fetches are on. It
+    is only picked over Shotgun when it is known to hold every event of the
+    range, see L{event_archive.EventArchive.getCompleteFirstId}.
+    """
+
+    # Number of seconds between two progress reports.
+    PROGRESS_INTERVAL = 10
+
+    def __init__(
+        self,
+        configPath,
+        pluginName,
+        startId,
+        endId,
+        source="auto",
+        concurrency=1,
+        connections=None,
+        batchSize=None,
+        prefetch=2,
+    ):
+        """
+        @param configPath: The path of the config file.
+        @type configPath: I{str}
+        @param pluginName: The name of the plugin, without its extension.
+        @type pluginName: I{str}
+        @param startId: The id of the first event to process.
+        @type startId: I{int}
+        @param endId: The id of the last event to process, included.
+        @type endId: I{int}
+        @param source: Where to get the events from, "archive", "shotgun" or
+            "auto" to use the archive when it holds every event of the range.
+        @type source: I{str}
+        @param concurrency: Minimum number of lanes of the plugin's
+            callbacks. Events of the same partition key still go through a
+            callback in order.
+        @type concurrency: I{int}
+        @param connections: Number of windows of events fetched from Shotgun
+            at once, defaults to parallel_fetch_connections.
+        @type connections: I{int}
+        @param batchSize: Number of events fetched at once, defaults to
+            max_event_batch_size.
+        @type batchSize: I{int}
+        @param prefetch: Number of batches fetched ahead of the plugin.
+        @type prefetch: I{int}
+
+        @raise ValueError: If the plugin or the archive can't be found.
+        """
+        self._engine = _ReplayEngine(configPath)
+        self.log = self._engine.log
+        self._startId = startId
+        self._endId = endId
+        self._connections = (
+            connections or self._engine.config.parallel_fetch_connections
+        )
+        self._batchSize = batchSize or self._engine.config.getMaxEventBatchSize()
+        self._queue = queue.Queue(maxsize=max(1, prefetch))
+        self._failed = False
+
+        pluginPath = None
+        paths = self._engine.config.getPluginPaths()
+        for path in paths:
+            if os.path.isfile(os.path.join(path, pluginName + ".py")):
+                pluginPath = os.path.join(path, pluginName + ".py")
+                break
+        if pluginPath is None:
+            raise ValueError(
+                "No plugin named %s in %s." % (pluginName, ", ".join(paths))
+            )
+        self._plugin = Plugin(self._engine, pluginPath, concurrency)
+
+        archive = self._engine._archive
+        completeFirstId = None
+        if archive is not None:
+            completeFirstId = archive.getCompleteFirstId()
+        complete = (
+            completeFirstId is not None
+            and completeFirstId <= startId
+            and archive.getLastId() >= endId
+        )
+        if source == "auto":
+            source = "archive" if complete else "shotgun"
+        elif source == "archive":
+            if archive is None:
+                raise ValueError("No event archive, see the event_archive_dir setting.")
+            if not complete:
+                self.log.warning(
+                    "The event archive may not hold every event from %d to %d, "
+                    "it was written with filtered fetches or skipped ahead.",
+                    startId,
+                    endId,
+                )
+        self._source = source
+
+    def run(self):
+        """
+        Process the events of the range.
+
+        @return: True if the plugin processed every event of the range.
+        @rtype: I{bool}
+        """
+        self._plugin.load()
+        if not self._plugin.isActive():
+            self.log.error("Plugin %s could not be loaded.", self._plugin)
+            return False
+        self._plugin.setState(self._startId - 1)
+
+        # Only download the events the plugin wants, and the entity fields
+        # its callbacks asked for.
+        callbacks = [c for c in self._plugin if c.isActive()]
+        self._engine._leanRoutes = _RoutingTable(callbacks)
+        self._engine._entityFieldRoutes = _RoutingTable(
+            [c for c in callbacks if c.getEntityFields()]
+        )
+
+        self.log.info(
+            "Replaying events %d to %d from %s for plugin %s.",
+            self._startId,
+            self._endId,
+            self._source,
+            self._plugin,
+        )
+        fetcher = threading.Thread(target=self._fetch, name="ReplayFetcher")
+        fetcher.daemon = True
+        fetcher.start()
+
+        count = 0
+        lastEventId = None
+        cancel = False
+        start = time.monotonic()
+        lastReport = start
+        try:
+            while self._plugin.isActive():
+                events = self._queue.get()
+                if events is None:
+                    break
+                for event in events:
+                    self._plugin.process(event)
+                    if event["event_type"] is not None:
+                        count += 1
+                lastEventId = events[-1]["id"]
+                self._plugin.flushWrites()
+
+                now = time.monotonic()
+                if now - lastReport > self.PROGRESS_INTERVAL:
+                    lastReport = now
+                    self.log.info(
+                        "Replayed up to event %d, %d events at %.1f events/s.",
+                        lastEventId,
+                        count,
+                        count / (now - start),
+                    )
+        except KeyboardInterrupt:
+            self.log.warning("Keyboard interrupt. Cleaning up...")
+            cancel = True
+        finally:
+            self._engine._continue = False
+            self._plugin.drain(cancel)
+            if self._engine._pluginHost is not None:
+                self._engine._pluginHost.shutdown()
+
+        elapsed = time.monotonic() - start
+        self.log.info(
+            "Replayed %d events up to event %s in %.1f seconds, %.1f events/s.",
+            count,
+            lastEventId,
+            elapsed,
+            count / elapsed if elapsed else 0.0,
+        )
+        if not self._plugin.isActive():
+            self.log.error("Plugin %s failed, see its log.", self._plugin)
+        return self._plugin.isActive() and not cancel and not self._failed
+
+    def _fetch(self):
+        """
+        Queue the batches of events of the range, then I{None}.
+        """
+        try:
+            if self._source == "archive":
+                batch = []
+                for event in self._engine._archive.iterEvents(
+                    self._startId, self._endId
+                ):
+                    batch.append(event)
+                    if len(batch) >= self._batchSize:
+                        self._put(batch)
+                        batch = []
+                    if not self._engine._continue:
+                        return
+                if batch:
+                    self._put(batch)
+            else:
+                rangeFetcher = _RangeFetcher(self._engine, self._connections)
+                cursor = self._startId
+                try:
+                    while self._engine._continue:
+                        events = rangeFetcher.getEvents(
+                            self._engine._sg, cursor, self._endId, self._batchSize
+                        )
+                        if not events:
+                            break
+                        self._put(events)
+                        cursor = events[-1]["id"] + 1
+                finally:
+                    rangeFetcher.shutdown()
+        except Exception:
+            self._failed = True
+            self.log.critical(
+                "Could not get the events to replay.\n\n%s", traceback.format_exc()
+            )
+        finally:
+            self._put(None)
+
+    def _put(self, item):
+        # Wait for room in the queue unless the replay is over.
+        while True:
+            try:
+                self._queue.put(item, timeout=1)
+                return
+            except queue.Full:
+                if not self._engine._continue:
+                    return
+
+
+def _replay(args):
+    """
+    Run the replay command, see L{Replay}.
+
+    @param args: The command line arguments after "replay".
+    @type args: I{list} of I{str}
+
+    @return: The exit status.
+    @rtype: I{int}
+    """
+    parser = argparse.ArgumentParser(
+        prog="%s replay" % sys.argv[0],
+        description="Run a plugin over past events, without touching the "
+        "daemon's event id file.",
+    )
+    parser.add_argument(
+        "--plugin",
+        metavar="NAME",
+        required=True,
+        help="Name of the plugin, without .py.",
+    )
+    parser.add_argument(
+        "--from",
+        dest="startId",
+        metavar="ID",
+        type=int,
+        required=True,
+        help="First event id.",
+    )
+    parser.add_argument(
+        "--to",
+        dest="endId",
+        metavar="ID",
+        type=int,
+        required=True,
+        help="Last event id, included.",
+    )
+    parser.add_argument(
+        "--source",
+        choices=("auto", "archive", "shotgun"),
+        default="auto",
+        help="Where to read the events from. auto uses the event archive when "
+        "it holds every event of the range.",
+    )
+    parser.add_argument(
+        "--concurrency",
+        metavar="N",
+        type=int,
+        default=1,
+        help="Minimum number of lanes of the plugin's callbacks. Events of the "
+        "same entity are still processed in order.",
+    )
+    parser.add_argument(
+        "--connections",
+        metavar="N",
+        type=int,
+        help="Number of windows of events fetched from Shotgun at once.",
+    )
+    parser.add_argument(
+        "--batch-size",
+        dest="batchSize",
+        metavar="N",
+        type=int,
+        help="Number of events fetched at once.",
+    )
+    parser.add_argument(
+        "--prefetch",
+        metavar="N",
+        type=int,
+        default=2,
+        help="Number of batches fetched ahead of the plugin.",
+    )
+    options = parser.parse_args(args)
+    if options.endId < options.startId:
+        parser.error("--to must not be lower than --from.")
+
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(levelname)s:%(name)s:%(message)s"))
+    logging.getLogger().addHandler(handler)
+
+    try:
+        replay = Replay(
+            _getConfigPath(),
+            options.plugin,
+            options.startId,
+            options.endId,
+            options.source,
+            options.concurrency,
+            options.connections,
+            options.batchSize,
+            options.prefetch,
+        )
+    except ValueError as err:
+        print(err)
+        return 2
+
+    if replay.run():
+        return 0
+    return 1
+
+
 def _getConfigPath():
     """
     Find the config path relative to this file defined by top level constant
@@ -1335,12 +4177,29 @@ def _getConfigPath():
     return CONFIG.path
 
 
+def _createEngine(configPath):
+    """
+    Create the engine selected by the async_engine setting.
+
+    @param configPath: The path of the config file.
+    @type configPath: I{str}
+
+    @rtype: L{Engine}
+    """
+    if handler_config.Config(configPath).async_engine:
+        return AsyncEngine(configPath)
+    return Engine(configPath)
+
+
 def main(action=None):
     """ """
 
     if len(sys.argv) > 1:
         action = sys.argv[1]
 
+    if action == "replay":
+        return _replay(sys.argv[2:])
+
     if action == "foreground":
         daemon = LinuxDaemon()
 
@@ -1356,7 +4215,7 @@ def main(action=None):
         win32serviceutil.HandleCommandLine(WindowsService)
         return 0
 
-    print("usage: %s start|stop|restart|foreground" % sys.argv[0])
+    print("usage: %s start|stop|restart|foreground|replay" % sys.argv[0])
     return 2
 
 
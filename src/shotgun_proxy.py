@@ -0,0 +1,1094 @@
+"""
+Wrap the Shotgun connections handed to plugin callbacks.
+
+Callbacks get a L{ShotgunProxy} rather than a bare L{shotgun_api3.Shotgun}.
+It behaves the same, but lets the daemon share work between all the plugins'
+connections, such as caching the schema.
+
+The connections themselves live in a L{ConnectionPool}. Opening one costs a
+TLS handshake and a server info call, so connections are kept open and reused
+by every proxy using the same credentials, across plugin reloads. A proxy
+borrows a connection for the duration of each call only, so it can be used
+from several threads at once.
+
+Calls made with the same script key go through a L{RateLimiter}, so the
+daemon stays within what the server accepts from a script however many
+callbacks run at once.
+
+When the server can't be reached, a L{CircuitBreaker} holds back the calls
+to it until a single probing call gets through, rather than every thread
+hammering it. Reads failing because of the network or an overloaded server
+are retried after a jittered exponential backoff.
+
+Callbacks registered with batchWrites get a L{BatchingShotgunProxy}, which
+holds back their creates, updates and deletes and sends them together with
+L{shotgun_api3.Shotgun.batch}.
+
+Coroutine callbacks run by the asyncio engine get an L{AsyncShotgunProxy},
+whose methods are awaited and run the calls on the event loop's executor.
+
+"""
+
+import asyncio
+import concurrent.futures
+import contextlib
+import copy
+import functools
+import inspect
+import random
+import socket
+import threading
+import time
+
+import shotgun_api3 as sg
+
+# Calls which don't change anything on the server and may be retried.
+READ_METHODS = frozenset(
+    [
+        "find",
+        "find_one",
+        "summarize",
+        "text_search",
+        "info",
+        "schema_read",
+        "schema_entity_read",
+        "schema_field_read",
+        "work_schedule_read",
+        "note_thread_read",
+        "activity_stream_read",
+        "following",
+        "followers",
+    ]
+)
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of waiting for the server to be back, once waiting was
+    interrupted.
+    """
+
+
+def backoffDelay(attempt, maxDelay, baseDelay=0.5):
+    """
+    Number of seconds to wait before trying again after some failed attempts.
+
+    The delay doubles with every attempt up to maxDelay. Half of it is
+    random, so callers failing together don't all try again together.
+
+    @param attempt: Number of attempts which failed, starting at 1.
+    @type attempt: I{int}
+    @param maxDelay: Maximum delay.
+    @type maxDelay: I{float}
+    @param baseDelay: Delay after the first attempt.
+    @type baseDelay: I{float}
+
+    @rtype: I{float}
+    """
+    delay = min(maxDelay, baseDelay * 2 ** min(attempt - 1, 32))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def isTransientError(err):
+    """
+    Could a call succeed if made again.
+
+    @param err: What the call raised.
+    @type err: L{Exception}
+
+    @rtype: I{bool}
+    """
+    return isOutageError(err) or getattr(err, "errcode", None) == 429
+
+
+def isOutageError(err):
+    """
+    Did a call fail because the server can't be reached or is down.
+
+    @param err: What the call raised.
+    @type err: L{Exception}
+
+    @rtype: I{bool}
+    """
+    if isinstance(err, sg.ProtocolError):
+        return err.errcode >= 500
+    return isinstance(err, (sg.ResponseError, socket.error))
+
+
+class SchemaCache(object):
+    """
+    Schema reads shared by all the callbacks' connections.
+
+    Entries expire after a while, and the whole cache is dropped when an event
+    shows the schema changed.
+    """
+
+    # Events of fields being created, changed or deleted, and of status list
+    # changes which change the valid values of status fields.
+    SCHEMA_EVENT_TYPES = frozenset(
+        "Shotgun_%s_%s" % (entityType, action)
+        for entityType in ("DisplayColumn", "Status")
+        for action in ("New", "Change", "Retirement", "Revival")
+    )
+
+    def __init__(self, ttl):
+        """
+        @param ttl: Number of seconds a schema read is kept.
+        @type ttl: I{float}
+        """
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._generation = 0
+
+    def get(self, key, read):
+        """
+        Get a schema read from the cache, reading it from Shotgun if needed.
+
+        @param key: What was read.
+        @type key: I{tuple}
+        @param read: Function reading the schema from Shotgun.
+        @type read: A function object.
+
+        @return: A copy of the schema read, callbacks may change it.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                return copy.deepcopy(entry[1])
+            generation = self._generation
+
+        value = read()
+
+        with self._lock:
+            # Don't keep what was read while the schema changed.
+            if generation == self._generation:
+                self._entries[key] = (now + self._ttl, value)
+        return copy.deepcopy(value)
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+
+    def processEvents(self, events):
+        """
+        Drop the cache if any of the events changed the schema.
+
+        @param events: Events fetched from Shotgun.
+        @type events: I{list} of Flow Production Tracking event dictionaries.
+
+        @return: True if the cache was dropped.
+        @rtype: I{bool}
+        """
+        for event in events:
+            if event["event_type"] in self.SCHEMA_EVENT_TYPES:
+                self.invalidate()
+                return True
+        return False
+
+
+class RateLimiter(object):
+    """
+    Limit the calls made with a script key.
+
+    A token bucket limits how many calls start per second, if a rate is
+    given. How many calls may run at once starts at the maximum and is
+    adjusted as calls complete: it is halved when the server says it is
+    overloaded or when calls start taking much longer than they usually do,
+    and grows back by one every time that many calls complete normally.
+    """
+
+    # Weights of the latest call in the short and long term latency averages.
+    SHORT_WEIGHT = 0.3
+    LONG_WEIGHT = 0.02
+
+    # The concurrency is halved when the short term latency gets this much
+    # higher than the long term one.
+    LATENCY_FACTOR = 2.0
+
+    def __init__(self, rate, burst, maxConcurrency):
+        """
+        @param rate: Number of calls per second, 0 for no limit.
+        @type rate: I{float}
+        @param burst: Number of calls which may start at once after a quiet
+            period.
+        @type burst: I{int}
+        @param maxConcurrency: Maximum number of calls running at once.
+        @type maxConcurrency: I{int}
+        """
+        self._rate = rate
+        self._burst = max(1, burst)
+        self._tokens = float(self._burst)
+        self._refilled = time.monotonic()
+        self._maxConcurrency = max(1, maxConcurrency)
+        self._concurrency = float(self._maxConcurrency)
+        self._running = 0
+        self._shortLatency = None
+        self._longLatency = None
+        self._decreased = 0.0
+        self._pausedUntil = 0.0
+        self._condition = threading.Condition()
+
+    def getConcurrency(self):
+        """
+        @return: How many calls may currently run at once.
+        @rtype: I{int}
+        """
+        return int(self._concurrency)
+
+    def _refill(self, now):
+        if self._rate > 0:
+            self._tokens = min(
+                self._burst, self._tokens + (now - self._refilled) * self._rate
+            )
+        self._refilled = now
+
+    def acquire(self):
+        """
+        Wait until a call may start.
+
+        @return: The time the call started, to pass to L{release}.
+        @rtype: I{float}
+        """
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                if self._pausedUntil > now:
+                    timeout = self._pausedUntil - now
+                elif self._running >= int(self._concurrency):
+                    timeout = None
+                elif self._rate > 0 and self._tokens < 1:
+                    timeout = (1 - self._tokens) / self._rate
+                else:
+                    if self._rate > 0:
+                        self._tokens -= 1
+                    self._running += 1
+                    return now
+                self._condition.wait(timeout)
+
+    def release(self, started, overloaded=False, retryAfter=None):
+        """
+        Account for a call which completed.
+
+        @param started: What L{acquire} returned.
+        @type started: I{float}
+        @param overloaded: True if the server turned the call down because
+            it is overloaded.
+        @type overloaded: I{bool}
+        @param retryAfter: Number of seconds the server asked to wait for.
+        @type retryAfter: I{float}
+        """
+        now = time.monotonic()
+        latency = now - started
+        with self._condition:
+            self._running -= 1
+            if overloaded:
+                self._decrease(now)
+                if retryAfter:
+                    self._pausedUntil = max(self._pausedUntil, now + retryAfter)
+            else:
+                if self._longLatency is None:
+                    self._shortLatency = self._longLatency = latency
+                else:
+                    self._shortLatency += self.SHORT_WEIGHT * (
+                        latency - self._shortLatency
+                    )
+                    self._longLatency += self.LONG_WEIGHT * (
+                        latency - self._longLatency
+                    )
+
+                if self._shortLatency > self.LATENCY_FACTOR * self._longLatency:
+                    self._decrease(now)
+                else:
+                    self._concurrency = min(
+                        self._maxConcurrency,
+                        self._concurrency + 1.0 / self._concurrency,
+                    )
+            self._condition.notify_all()
+
+    def restart(self):
+        """
+        Start again from a low concurrency and an empty bucket, so calls held
+        back during an outage don't all hit the server at once when it is
+        back.
+        """
+        with self._condition:
+            self._tokens = 0.0
+            self._refilled = time.monotonic()
+            self._concurrency = 1.0
+            self._condition.notify_all()
+
+    def _decrease(self, now):
+        # Calls running at the time of a decrease complete in about a call's
+        # time, don't count them again.
+        if now - self._decreased >= (self._longLatency or 0):
+            self._concurrency = max(1.0, self._concurrency / 2)
+            self._decreased = now
+
+
+class CircuitBreaker(object):
+    """
+    Hold back the calls to a server after several calls in a row failed to
+    reach it.
+
+    Once open, callers wait. After a while one caller is let through to probe
+    the server. If the probe succeeds, all the callers go on, otherwise the
+    next probe waits twice as long, up to a maximum.
+    """
+
+    def __init__(self, failures, maxOpenTime, logger=None, onClose=None):
+        """
+        @param failures: Number of calls failing in a row which opens the
+            breaker.
+        @type failures: I{int}
+        @param maxOpenTime: Maximum number of seconds between two probes.
+        @type maxOpenTime: I{float}
+        @param logger: Where to log the breaker opening and closing.
+        @type logger: L{logging.Logger}
+        @param onClose: Function called when the breaker closes again.
+        @type onClose: A function object.
+        """
+        self._threshold = max(1, failures)
+        self._maxOpenTime = maxOpenTime
+        self._logger = logger
+        self._onClose = onClose
+        self._failures = 0
+        self._open = False
+        self._opened = 0
+        self._openUntil = 0.0
+        self._probing = False
+        self._interrupted = False
+        self._condition = threading.Condition()
+
+    def isOpen(self):
+        return self._open
+
+    def wait(self):
+        """
+        Wait until a call may be made.
+
+        @return: True if the call is the probe, in which case its outcome
+            must be passed to L{record}.
+        @rtype: I{bool}
+
+        @raise CircuitOpenError: If the breaker is open and L{interrupt} was
+            called.
+        """
+        with self._condition:
+            while self._open:
+                if self._interrupted:
+                    raise CircuitOpenError("The Shotgun server can't be reached.")
+
+                now = time.monotonic()
+                if not self._probing and now >= self._openUntil:
+                    self._probing = True
+                    return True
+
+                timeout = None
+                if not self._probing:
+                    timeout = self._openUntil - now
+                self._condition.wait(timeout)
+        return False
+
+    def record(self, failed, probe=False):
+        """
+        Account for a call which completed.
+
+        @param failed: True if the call failed to reach the server.
+        @type failed: I{bool}
+        @param probe: What L{wait} returned.
+        @type probe: I{bool}
+        """
+        closed = False
+        with self._condition:
+            if failed:
+                self._failures += 1
+                if probe or (not self._open and self._failures >= self._threshold):
+                    self._opened += 1
+                    delay = backoffDelay(self._opened, self._maxOpenTime)
+                    self._openUntil = time.monotonic() + delay
+                    self._open = True
+                    self._probing = False
+                    if self._logger is not None:
+                        self._logger.warning(
+                            "Could not reach Shotgun %d times in a row, holding "
+                            "back calls for %.1f seconds.",
+                            self._failures,
+                            delay,
+                        )
+            else:
+                self._failures = 0
+                if self._open:
+                    self._open = False
+                    self._opened = 0
+                    self._probing = False
+                    closed = True
+            self._condition.notify_all()
+
+        if closed:
+            if self._logger is not None:
+                self._logger.info("Shotgun is back, resuming calls.")
+            if self._onClose is not None:
+                self._onClose()
+
+    def interrupt(self):
+        """
+        Make callers waiting for the server, now or later, raise
+        L{CircuitOpenError} instead.
+        """
+        with self._condition:
+            self._interrupted = True
+            self._condition.notify_all()
+
+
+class ConnectionPool(object):
+    """
+    Open Shotgun connections, shared by everything using the same server,
+    credentials and proxy.
+    """
+
+    def __init__(
+        self,
+        connect,
+        schemaCache=None,
+        rate=0,
+        burst=1,
+        maxConcurrency=None,
+        retries=0,
+        breakerFailures=5,
+        maxRetryDelay=60,
+        logger=None,
+    ):
+        """
+        @param connect: Function opening a connection, taking the server url,
+            script name, script key and proxy server.
+        @type connect: A function object.
+        @param schemaCache: Cache for the schema reads of the proxies, if any.
+        @type schemaCache: L{SchemaCache}
+        @param rate: Number of calls per second per script key, 0 for no
+            limit.
+        @type rate: I{float}
+        @param burst: Number of calls per script key which may start at once
+            after a quiet period.
+        @type burst: I{int}
+        @param maxConcurrency: Maximum number of calls running at once per
+            script key, None to not limit calls at all.
+        @type maxConcurrency: I{int}
+        @param retries: Number of times a read failing because of the network
+            or an overloaded server is made again.
+        @type retries: I{int}
+        @param breakerFailures: Number of calls to a server failing in a row
+            after which calls to it are held back, 0 to never hold them back.
+        @type breakerFailures: I{int}
+        @param maxRetryDelay: Maximum number of seconds between two attempts.
+        @type maxRetryDelay: I{float}
+        @param logger: Where to log outages.
+        @type logger: L{logging.Logger}
+        """
+        self._connect = connect
+        self._schemaCache = schemaCache
+        self._rate = rate
+        self._burst = burst
+        self._maxConcurrency = maxConcurrency
+        self._retries = retries
+        self._breakerFailures = breakerFailures
+        self._maxRetryDelay = maxRetryDelay
+        self._logger = logger
+        self._lock = threading.Lock()
+        self._idle = {}
+        self._limiters = {}
+        self._breakers = {}
+
+    def getShotgun(self, url, scriptName, scriptKey, proxy=None):
+        """
+        Get a connection to use from any thread.
+
+        No connection is opened until the first call made with it.
+
+        @param url: The url of the Shotgun server.
+        @type url: I{str}
+        @param scriptName: The name of the script to connect as.
+        @type scriptName: I{str}
+        @param scriptKey: The key of the script.
+        @type scriptKey: I{str}
+        @param proxy: The proxy server to go through, if any.
+        @type proxy: I{str}
+
+        @rtype: L{ShotgunProxy}
+        """
+        return ShotgunProxy(self, (url, scriptName, scriptKey, proxy or None))
+
+    def getBatchingShotgun(
+        self, url, scriptName, scriptKey, proxy, batchSize, batchInterval, logger
+    ):
+        """
+        Get a connection holding back its writes, see L{getShotgun} and
+        L{BatchingShotgunProxy}.
+
+        @rtype: L{BatchingShotgunProxy}
+        """
+        return BatchingShotgunProxy(
+            self,
+            (url, scriptName, scriptKey, proxy or None),
+            batchSize,
+            batchInterval,
+            logger,
+        )
+
+    def getSchemaCache(self):
+        return self._schemaCache
+
+    def getRetries(self):
+        return self._retries
+
+    def getMaxRetryDelay(self):
+        return self._maxRetryDelay
+
+    def getCircuitBreaker(self, url):
+        """
+        @param url: The url of the Shotgun server.
+        @type url: I{str}
+
+        @return: The breaker of the server, None if calls are never held
+            back.
+        @rtype: L{CircuitBreaker}
+        """
+        if not self._breakerFailures:
+            return None
+
+        with self._lock:
+            breaker = self._breakers.get(url)
+            if breaker is None:
+                breaker = CircuitBreaker(
+                    self._breakerFailures,
+                    self._maxRetryDelay,
+                    self._logger,
+                    lambda: self._restartLimiters(url),
+                )
+                self._breakers[url] = breaker
+        return breaker
+
+    def _restartLimiters(self, url):
+        with self._lock:
+            limiters = [l for k, l in self._limiters.items() if k[0] == url]
+        for limiter in limiters:
+            limiter.restart()
+
+    def interrupt(self):
+        """
+        Stop waiting for servers which can't be reached, calls to them raise
+        L{CircuitOpenError} from now on.
+        """
+        with self._lock:
+            breakers = list(self._breakers.values())
+        for breaker in breakers:
+            breaker.interrupt()
+
+    def getRateLimiter(self, key):
+        """
+        @param key: The (url, script name, script key, proxy) to connect with.
+        @type key: I{tuple}
+
+        @return: The limiter of the key's script key, None if calls are not
+            limited.
+        @rtype: L{RateLimiter}
+        """
+        if self._maxConcurrency is None:
+            return None
+
+        with self._lock:
+            limiter = self._limiters.get((key[0], key[2]))
+            if limiter is None:
+                limiter = RateLimiter(self._rate, self._burst, self._maxConcurrency)
+                self._limiters[(key[0], key[2])] = limiter
+        return limiter
+
+    @contextlib.contextmanager
+    def connection(self, key, sessionUuid=None, limit=True):
+        """
+        Borrow a connection, opening one if they are all in use.
+
+        @param key: The (url, script name, script key, proxy) to connect with.
+        @type key: I{tuple}
+        @param sessionUuid: The session uuid to set on the connection.
+        @type sessionUuid: I{str}
+        @param limit: False if no call is made with the connection, which
+            then doesn't wait for the rate limiter.
+        @type limit: I{bool}
+        """
+        breaker = self.getCircuitBreaker(key[0]) if limit else None
+        probe = breaker.wait() if breaker is not None else False
+        limiter = self.getRateLimiter(key) if limit else None
+        if limiter is not None:
+            started = limiter.acquire()
+
+        overloaded, retryAfter = False, None
+        outage = False
+        connection = None
+        try:
+            with self._lock:
+                idle = self._idle.get(key)
+                if idle:
+                    connection = idle.pop()
+            if connection is None:
+                connection = self._connect(*key)
+
+            # The connection was last used by someone else, don't keep their
+            # session uuid.
+            connection.set_session_uuid(sessionUuid)
+            yield connection
+        except Exception as err:
+            overloaded, retryAfter = _isOverloaded(err)
+            outage = isOutageError(err)
+            raise
+        finally:
+            if limiter is not None:
+                limiter.release(started, overloaded, retryAfter)
+            if breaker is not None:
+                breaker.record(outage, probe)
+            if connection is not None:
+                # Connections are kept even when the call failed, the api
+                # resets its http connection itself after network errors.
+                with self._lock:
+                    self._idle.setdefault(key, []).append(connection)
+
+
+class ShotgunProxy(object):
+    """
+    A Shotgun connection going through the daemon's shared services.
+
+    Any attribute not defined here is looked up on a connection borrowed from
+    the pool. Methods borrow a connection for each call, changing other
+    attributes of the connection is not supported.
+    """
+
+    def __init__(self, pool, key):
+        """
+        @param pool: The pool to borrow connections from.
+        @type pool: L{ConnectionPool}
+        @param key: The (url, script name, script key, proxy) to connect with.
+        @type key: I{tuple}
+        """
+        self._pool = pool
+        self._key = key
+        self._schemaCache = pool.getSchemaCache()
+        self._sessionUuid = None
+
+    def __getattr__(self, name):
+        # Tell methods from the class, a connection is only borrowed for the
+        # call itself.
+        if not inspect.isfunction(getattr(sg.Shotgun, name, None)):
+            with self._pool.connection(self._key, limit=False) as connection:
+                return getattr(connection, name)
+
+        def call(*args, **kwargs):
+            return self._call(name, *args, **kwargs)
+
+        call.__name__ = name
+        return call
+
+    def _call(self, method, *args, **kwargs):
+        retries = self._pool.getRetries() if method in READ_METHODS else 0
+        attempt = 0
+        while True:
+            try:
+                with self._pool.connection(self._key, self._sessionUuid) as conn:
+                    return getattr(conn, method)(*args, **kwargs)
+            except Exception as err:
+                attempt += 1
+                if attempt > retries or not isTransientError(err):
+                    raise
+            time.sleep(backoffDelay(attempt, self._pool.getMaxRetryDelay()))
+
+    def set_session_uuid(self, session_uuid):
+        self._sessionUuid = session_uuid
+
+    def _readSchema(self, method, args, project_entity):
+        if self._schemaCache is None:
+            return self._call(method, *args, project_entity=project_entity)
+
+        project = None
+        if project_entity:
+            project = (project_entity.get("type"), project_entity.get("id"))
+        return self._schemaCache.get(
+            (method, args, project),
+            lambda: self._call(method, *args, project_entity=project_entity),
+        )
+
+    def schema_read(self, project_entity=None):
+        return self._readSchema("schema_read", (), project_entity)
+
+    def schema_entity_read(self, project_entity=None):
+        return self._readSchema("schema_entity_read", (), project_entity)
+
+    def schema_field_read(self, entity_type, field_name=None, project_entity=None):
+        return self._readSchema(
+            "schema_field_read", (entity_type, field_name), project_entity
+        )
+
+
+class AsyncShotgunProxy(object):
+    """
+    An awaitable facade over a L{ShotgunProxy} for coroutine callbacks.
+
+    Every method of L{shotgun_api3.Shotgun} is a coroutine function here,
+    running the call on the event loop's executor so it doesn't hold up the
+    loop, e.g. C{await sg.find("Shot", filters)}. Calls wait for a slot of
+    the semaphore of their script key first. Other attributes are read from
+    the proxy.
+    """
+
+    def __init__(self, shotgun, semaphore):
+        """
+        @param shotgun: The proxy to make the calls with.
+        @type shotgun: L{ShotgunProxy}
+        @param semaphore: Bounds the calls running at once.
+        @type semaphore: L{asyncio.Semaphore}
+        """
+        self._shotgun = shotgun
+        self._semaphore = semaphore
+
+    def __getattr__(self, name):
+        if not inspect.isfunction(getattr(sg.Shotgun, name, None)):
+            return getattr(self._shotgun, name)
+
+        async def call(*args, **kwargs):
+            method = functools.partial(getattr(self._shotgun, name), *args, **kwargs)
+            async with self._semaphore:
+                loop = asyncio.get_running_loop()
+                return await loop.run_in_executor(None, method)
+
+        call.__name__ = name
+        return call
+
+    def set_session_uuid(self, session_uuid):
+        self._shotgun.set_session_uuid(session_uuid)
+
+
+class _Writes(object):
+    """
+    The writes of one callback call.
+    """
+
+    def __init__(self):
+        self.future = concurrent.futures.Future()
+        self.pending = 0
+        self.closed = False
+
+    def resolve(self, success):
+        if not self.future.done():
+            self.future.set_result(success)
+
+
+class _Request(object):
+    """
+    A request of a batch call, and the callback calls it sends writes of.
+    """
+
+    def __init__(self, request):
+        self.request = request
+        self.owners = []
+
+    def addOwner(self, writes):
+        if writes not in self.owners:
+            self.owners.append(writes)
+            writes.pending += 1
+
+    def touches(self, entityType, field):
+        if self.request["entity_type"] != entityType:
+            return False
+        if self.request["request_type"] != "update":
+            return True
+        return field in self.request["data"]
+
+
+class BatchingShotgunProxy(ShotgunProxy):
+    """
+    A connection holding back creates, updates and deletes, and sending them
+    with batch calls.
+
+    Writes are sent when enough of them were held back, a while after the
+    first of them, or when L{flush} is called, which the engine does after
+    each batch of events. Updates of the same entity are merged, the last value of a field
+    wins, unless a create, delete or list update was held in between.
+
+    Reads see the held back writes: reads involving an entity type or field
+    with pending writes send them first, as does any call other than a find
+    or a schema read.
+
+    Writes return what they would once sent, minus the ids of created
+    entities which are only known after the batch call. Use L{mark} after
+    each callback call to know when its writes are sent.
+    """
+
+    def __init__(self, pool, key, batchSize, batchInterval, logger):
+        """
+        @param pool: The pool to borrow connections from.
+        @type pool: L{ConnectionPool}
+        @param key: The (url, script name, script key, proxy) to connect with.
+        @type key: I{tuple}
+        @param batchSize: Number of writes after which they are sent, and
+            the number of writes per batch call.
+        @type batchSize: I{int}
+        @param batchInterval: Number of milliseconds after which held back
+            writes are sent.
+        @type batchInterval: I{int}
+        @param logger: Where to log failed batch calls.
+        @type logger: L{logging.Logger}
+        """
+        super(BatchingShotgunProxy, self).__init__(pool, key)
+        self._batchSize = max(1, batchSize)
+        self._batchInterval = batchInterval / 1000.0
+        self._logger = logger
+
+        # Guards the requests, the flush lock keeps batch calls in order.
+        self._lock = threading.Lock()
+        self._flushLock = threading.Lock()
+        self._requests = []
+        self._sending = []
+        self._updates = {}
+        self._writes = None
+        self._firstWrite = None
+        self._timer = None
+
+    def _hold(self, request, key=None):
+        with self._lock:
+            if self._writes is None:
+                self._writes = _Writes()
+
+            if key is None:
+                # Later updates must not merge into ones held before this
+                # request, they would be sent ahead of it.
+                self._updates.clear()
+
+            if key in self._updates:
+                held = self._updates[key]
+                held.request["data"].update(request["data"])
+            else:
+                held = _Request(request)
+                self._requests.append(held)
+                if key is not None:
+                    self._updates[key] = held
+            held.addOwner(self._writes)
+
+            if self._firstWrite is None:
+                self._firstWrite = time.time()
+                # Send the writes even if no other write or flush comes,
+                # the events they belong to wait for them.
+                self._timer = threading.Timer(self._batchInterval, self._flushDue)
+                self._timer.daemon = True
+                self._timer.start()
+            full = (
+                len(self._requests) >= self._batchSize
+                or time.time() - self._firstWrite >= self._batchInterval
+            )
+
+        if full:
+            self.flush()
+
+    def _flushDue(self):
+        with self._lock:
+            due = self._firstWrite is not None
+        if due:
+            self.flush()
+
+    def create(self, entity_type, data, return_fields=None):
+        request = {
+            "request_type": "create",
+            "entity_type": entity_type,
+            "data": copy.deepcopy(data),
+        }
+        if return_fields:
+            request["return_fields"] = list(return_fields)
+        self._hold(request)
+
+        result = copy.deepcopy(data)
+        result["type"] = entity_type
+        result["id"] = None
+        return result
+
+    def update(self, entity_type, entity_id, data, multi_entity_update_modes=None):
+        request = {
+            "request_type": "update",
+            "entity_type": entity_type,
+            "entity_id": entity_id,
+            "data": copy.deepcopy(data),
+        }
+        key = (entity_type, entity_id)
+        if multi_entity_update_modes:
+            # Adding to or removing from a list doesn't merge with other
+            # updates.
+            request["multi_entity_update_modes"] = multi_entity_update_modes
+            key = None
+        self._hold(request, key)
+
+        result = copy.deepcopy(data)
+        result["type"] = entity_type
+        result["id"] = entity_id
+        return result
+
+    def delete(self, entity_type, entity_id):
+        self._hold(
+            {
+                "request_type": "delete",
+                "entity_type": entity_type,
+                "entity_id": entity_id,
+            }
+        )
+        return True
+
+    def _touches(self, entityType, fields):
+        """
+        Are there writes pending on some fields, in the form of find
+        filters and fields, linked fields included.
+        """
+        pairs = []
+        for field in fields:
+            parts = field.split(".")
+            pairs.append((entityType, parts[0]))
+            for i in range(1, len(parts) - 1, 2):
+                pairs.append((parts[i], parts[i + 1]))
+
+        with self._lock:
+            for held in self._sending + self._requests:
+                for pairEntityType, field in pairs:
+                    if held.touches(pairEntityType, field):
+                        return True
+        return False
+
+    def find(self, entity_type, filters, fields=None, order=None, *args, **kwargs):
+        readFields = list(_filterFields(filters))
+        readFields.extend(fields or [])
+        readFields.extend(o.get("field_name", "") for o in order or [])
+        if self._touches(entity_type, readFields or ["id"]):
+            self.flush()
+        return self._call("find", entity_type, filters, fields, order, *args, **kwargs)
+
+    def find_one(self, entity_type, filters, fields=None, order=None, *args, **kwargs):
+        readFields = list(_filterFields(filters))
+        readFields.extend(fields or [])
+        readFields.extend(o.get("field_name", "") for o in order or [])
+        if self._touches(entity_type, readFields or ["id"]):
+            self.flush()
+        return self._call(
+            "find_one", entity_type, filters, fields, order, *args, **kwargs
+        )
+
+    def _call(self, method, *args, **kwargs):
+        if method not in ("find", "find_one") and not method.startswith("schema_"):
+            # Any other call might see or conflict with held back writes.
+            self.flush()
+        return super(BatchingShotgunProxy, self)._call(method, *args, **kwargs)
+
+    def set_session_uuid(self, session_uuid):
+        if session_uuid != self._sessionUuid:
+            # Writes are sent with the session uuid of their event.
+            self.flush()
+        super(BatchingShotgunProxy, self).set_session_uuid(session_uuid)
+
+    def mark(self):
+        """
+        Close the writes made since the last call, usually by a callback
+        call on one event.
+
+        @return: A future resolving to True once the writes are sent, or to
+            False if sending them failed. None if there were no writes.
+        @rtype: L{concurrent.futures.Future}
+        """
+        with self._lock:
+            writes, self._writes = self._writes, None
+            if writes is None:
+                return None
+            writes.closed = True
+            if not writes.pending:
+                writes.resolve(True)
+        return writes.future
+
+    def flush(self):
+        """
+        Send the held back writes.
+
+        @return: False if a batch call failed. The writes it and the following
+            batch calls were to send are dropped.
+        @rtype: I{bool}
+        """
+        with self._flushLock:
+            with self._lock:
+                requests = self._sending = self._requests
+                self._requests = []
+                self._updates = {}
+                self._firstWrite = None
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                sessionUuid = self._sessionUuid
+
+            try:
+                for start in range(0, len(requests), self._batchSize):
+                    chunk = requests[start : start + self._batchSize]
+                    try:
+                        with self._pool.connection(self._key, sessionUuid) as conn:
+                            conn.batch([held.request for held in chunk])
+                    except Exception:
+                        self._logger.exception(
+                            "Could not send %d held back writes.",
+                            len(requests) - start,
+                        )
+                        for held in requests[start:]:
+                            for writes in held.owners:
+                                writes.resolve(False)
+                        return False
+
+                    with self._lock:
+                        done = []
+                        for held in chunk:
+                            for writes in held.owners:
+                                writes.pending -= 1
+                                if writes.closed and not writes.pending:
+                                    done.append(writes)
+                    # Resolve outside of the lock, the futures' callbacks
+                    # may use this connection.
+                    for writes in done:
+                        writes.resolve(True)
+            finally:
+                with self._lock:
+                    self._sending = []
+        return True
+
+
+def _isOverloaded(err):
+    """
+    Did a call fail because the server is overloaded.
+
+    @return: Whether it did, and the number of seconds the server asked to
+        wait for, if it did.
+    @rtype: I{tuple}
+    """
+    # shotgun_api3.ProtocolError carries the http status and headers.
+    if getattr(err, "errcode", None) not in (429, 502, 503, 504):
+        return False, None
+
+    retryAfter = None
+    headers = getattr(err, "headers", None) or {}
+    try:
+        retryAfter = float(headers.get("retry-after") or headers.get("Retry-After"))
+    except (AttributeError, TypeError, ValueError):
+        pass
+    return True, retryAfter
+
+
+def _filterFields(filters):
+    """
+    The fields used in some find filters.
+    """
+    if isinstance(filters, dict):
+        filters = filters.get("filters", [])
+    for condition in filters or []:
+        if isinstance(condition, dict):
+            for field in _filterFields(condition):
+                yield field
+        elif condition:
+            yield condition[0]
@@ -0,0 +1,699 @@
+"""
+A local stand-in for a Flow Production Tracking site, to run and benchmark
+the daemon end to end without a live site.
+
+It speaks enough of the JSON RPC protocol shotgun_api3 uses for the daemon
+and its plugins: info, read (find, find_one and paging through the event
+log), create, update, delete, batch and schema_field_read. Entities live in
+memory and every write adds the event log entries a site would, so plugins
+writing back see their own events. Latency, errors and a steady flow of
+new events can be injected.
+
+Run it on its own and point the flow server setting at it::
+
+    python shotgun_stand_in.py --port 8765 --events 100000 --event-rate 50
+
+or start a L{StandInServer} from a test. Any script name and key are
+accepted.
+
+"""
+
+from __future__ import print_function
+
+import argparse
+import bisect
+import datetime
+import json
+import random
+import threading
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+
+    class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+        daemon_threads = True
+
+
+API_PATH = "/api3/json"
+
+# The version reported to clients, recent enough for them to page without
+# counting records.
+SERVER_VERSION = [8, 50, 0]
+
+DATE_TIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+STATUSES = ["wtg", "ip", "rev", "apr", "fin"]
+
+
+class Fault(Exception):
+    """
+    An error returned to the client in the body of the response, raised as a
+    shotgun_api3.Fault on its side.
+    """
+
+
+class StandInStore(object):
+    """
+    The entities of the stand-in site, by type and id.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._records = {}
+        # The ids of every type in order, entities are never given an id
+        # lower than an existing one.
+        self._ids = {}
+        self._nextIds = {}
+
+    def seed(self, entities=100):
+        """
+        Create a project and a few shots, versions and tasks in it.
+
+        @param entities: Number of entities of each type.
+        @type entities: I{int}
+        """
+        with self._lock:
+            project = self.create("Project", {"name": "Stand-in"}, logEvent=False)
+            project = _link(project)
+            for index in range(entities):
+                shot = self.create(
+                    "Shot",
+                    {
+                        "code": "sh%04d" % index,
+                        "project": project,
+                        "sg_status_list": "wtg",
+                    },
+                    logEvent=False,
+                )
+                self.create(
+                    "Version",
+                    {
+                        "code": "sh%04d_v001" % index,
+                        "project": project,
+                        "entity": _link(shot),
+                        "sg_status_list": "wtg",
+                    },
+                    logEvent=False,
+                )
+                self.create(
+                    "Task",
+                    {
+                        "content": "comp",
+                        "project": project,
+                        "entity": _link(shot),
+                        "sg_status_list": "wtg",
+                    },
+                    logEvent=False,
+                )
+
+    def generateEvents(self, count, user=None):
+        """
+        Change the status of random versions, logging an event for each.
+
+        @param count: Number of events to generate.
+        @type count: I{int}
+        @param user: The user making the changes.
+        @type user: I{dict}
+        """
+        with self._lock:
+            versionIds = self._ids.get("Version")
+            if not versionIds:
+                return
+            for index in range(count):
+                self.update(
+                    "Version",
+                    random.choice(versionIds),
+                    {"sg_status_list": random.choice(STATUSES)},
+                    user=user,
+                )
+
+    def _newId(self, entityType):
+        entityId = self._nextIds.get(entityType, 1)
+        self._nextIds[entityType] = entityId + 1
+        self._ids.setdefault(entityType, []).append(entityId)
+        return entityId
+
+    def _get(self, entityType, entityId):
+        record = self._records.get(entityType, {}).get(entityId)
+        if record is None or record.get("retired"):
+            raise Fault("%s %s does not exist." % (entityType, entityId))
+        return record
+
+    def create(self, entityType, data, returnFields=None, user=None, logEvent=True):
+        """
+        @return: The new entity with the returned fields.
+        @rtype: I{dict}
+        """
+        with self._lock:
+            entityId = self._newId(entityType)
+            record = {"type": entityType, "id": entityId}
+            record.update(data)
+            record.setdefault("created_at", _now())
+            self._records.setdefault(entityType, {})[entityId] = record
+            if logEvent:
+                self._logEvent(record, "New", None, None, None, user)
+            return self._project(record, ["id"] + list(returnFields or data))
+
+    def update(self, entityType, entityId, data, modes=None, user=None):
+        """
+        @param modes: The multi entity update mode of fields, "set", "add"
+            or "remove".
+        @type modes: I{dict}
+
+        @return: The entity with the updated fields.
+        @rtype: I{dict}
+        """
+        modes = modes or {}
+        with self._lock:
+            record = self._get(entityType, entityId)
+            for field, value in data.items():
+                old = record.get(field)
+                mode = modes.get(field, "set")
+                if mode in ("add", "remove") and isinstance(value, list):
+                    current = [e for e in (old or [])]
+                    keys = set((e["type"], e["id"]) for e in value)
+                    if mode == "add":
+                        known = set((e["type"], e["id"]) for e in current)
+                        current.extend(
+                            e for e in value if (e["type"], e["id"]) not in known
+                        )
+                    else:
+                        current = [
+                            e for e in current if (e["type"], e["id"]) not in keys
+                        ]
+                    value = current
+                record[field] = value
+                self._logEvent(record, "Change", field, old, value, user)
+            return self._project(record, ["id"] + list(data))
+
+    def delete(self, entityType, entityId, user=None):
+        """
+        @return: True if the entity was retired.
+        @rtype: I{bool}
+        """
+        with self._lock:
+            record = self._get(entityType, entityId)
+            record["retired"] = True
+            self._logEvent(record, "Retirement", None, None, None, user)
+            return True
+
+    def _logEvent(self, record, action, field, old, new, user):
+        if record["type"] == "EventLogEntry":
+            return
+        meta = {
+            "type": "attribute_change" if action == "Change" else "entity_" + action,
+            "entity_type": record["type"],
+            "entity_id": record["id"],
+        }
+        if field is not None:
+            meta.update({"attribute_name": field, "old_value": old, "new_value": new})
+        entityId = self._newId("EventLogEntry")
+        self._records.setdefault("EventLogEntry", {})[entityId] = {
+            "type": "EventLogEntry",
+            "id": entityId,
+            "event_type": "Shotgun_%s_%s" % (record["type"], action),
+            "attribute_name": field,
+            "meta": meta,
+            "entity": _link(record),
+            "user": user,
+            "project": record.get("project"),
+            "session_uuid": None,
+            "description": None,
+            "created_at": _now(),
+        }
+
+    def read(self, entityType, filters, fields, sorts, page, perPage, retired):
+        """
+        @return: The page of records matching the filters, and whether
+            there is a next page.
+        @rtype: I{tuple}
+        """
+        with self._lock:
+            records = self._records.get(entityType, {})
+            matches = []
+            for entityId in self._candidates(entityType, filters):
+                record = records.get(entityId)
+                if record is None or bool(record.get("retired")) != retired:
+                    continue
+                if _matches(record, filters):
+                    matches.append(record)
+
+            for sort in reversed(sorts or []):
+                matches.sort(
+                    key=lambda r: _sortKey(r.get(sort["field_name"])),
+                    reverse=sort.get("direction") == "desc",
+                )
+
+            start = (page - 1) * perPage
+            found = matches[start : start + perPage]
+            return (
+                [self._project(r, fields) for r in found],
+                len(matches) > start + perPage,
+            )
+
+    def _candidates(self, entityType, filters):
+        """
+        Narrow down the ids to look at with the conditions on the id, most
+        event log reads ask for a range of ids.
+        """
+        ids = self._ids.get(entityType, [])
+        if filters.get("logical_operator", "and") != "and":
+            return ids
+
+        low, high = 0, len(ids)
+        for condition in filters.get("conditions", []):
+            if condition.get("path") != "id":
+                continue
+            relation, values = condition["relation"], condition["values"]
+            if relation == "greater_than":
+                low = max(low, bisect.bisect_right(ids, values[0]))
+            elif relation == "less_than":
+                high = min(high, bisect.bisect_left(ids, values[0]))
+            elif relation == "between":
+                low = max(low, bisect.bisect_left(ids, values[0]))
+                high = min(high, bisect.bisect_right(ids, values[1]))
+            elif relation in ("is", "in"):
+                return sorted(set(values))
+        return ids[low:high]
+
+    def _project(self, record, fields):
+        result = {"type": record["type"], "id": record["id"]}
+        for field in fields:
+            if field not in result:
+                result[field] = record.get(field)
+        return result
+
+    def readSchema(self, entityType, fieldName=None):
+        """
+        @return: The schema of the fields of an entity type, or of one of
+            them.
+        @rtype: I{dict}
+        """
+        with self._lock:
+            dataTypes = {"id": "number"}
+            for record in self._records.get(entityType, {}).values():
+                for field, value in record.items():
+                    if field not in dataTypes or value is not None:
+                        dataTypes[field] = _dataType(value)
+                break
+
+        if fieldName is not None:
+            if fieldName not in dataTypes:
+                raise Fault("%s has no field %s." % (entityType, fieldName))
+            dataTypes = {fieldName: dataTypes[fieldName]}
+
+        return dict(
+            (
+                field,
+                {
+                    "data_type": {"editable": False, "value": dataType},
+                    "name": {"editable": True, "value": field},
+                    "entity_type": {"editable": False, "value": entityType},
+                    "properties": {},
+                },
+            )
+            for field, dataType in dataTypes.items()
+        )
+
+
+class StandInServer(object):
+    """
+    An HTTP server answering shotgun_api3 calls from a L{StandInStore}.
+    """
+
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=0,
+        store=None,
+        latency=0,
+        errorRate=0.0,
+        errorStatus=503,
+        eventRate=0,
+    ):
+        """
+        @param host: The address to listen on.
+        @type host: I{str}
+        @param port: The port to listen on, 0 for any free one.
+        @type port: I{int}
+        @param store: The entities to serve, a seeded store by default.
+        @type store: L{StandInStore}
+        @param latency: Average number of milliseconds added to every call.
+        @type latency: I{float}
+        @param errorRate: Fraction of calls answered with errorStatus.
+        @type errorRate: I{float}
+        @param errorStatus: The HTTP status of failed calls.
+        @type errorStatus: I{int}
+        @param eventRate: Number of events generated every second.
+        @type eventRate: I{float}
+        """
+        if store is None:
+            store = StandInStore()
+            store.seed()
+        self.store = store
+        self.latency = latency
+        self.errorRate = errorRate
+        self.errorStatus = errorStatus
+        self.eventRate = eventRate
+        self.calls = {}
+        self._callsLock = threading.Lock()
+        self._stopped = threading.Event()
+        self._threads = []
+
+        self._httpServer = ThreadingHTTPServer((host, port), _Handler)
+        self._httpServer.daemon_threads = True
+        self._httpServer.standIn = self
+
+    @property
+    def url(self):
+        host, port = self._httpServer.server_address[:2]
+        return "http://%s:%d" % (host, port)
+
+    def start(self):
+        """
+        Serve calls and generate events on background threads.
+        """
+        self._threads = [
+            threading.Thread(
+                target=self._httpServer.serve_forever, name="StandInServer"
+            ),
+            threading.Thread(target=self._generateEvents, name="StandInEvents"),
+        ]
+        for thread in self._threads:
+            thread.daemon = True
+            thread.start()
+
+    def serveForever(self):
+        """
+        Generate events on a background thread and serve calls until
+        interrupted.
+        """
+        self._threads = [
+            threading.Thread(target=self._generateEvents, name="StandInEvents")
+        ]
+        self._threads[0].daemon = True
+        self._threads[0].start()
+        try:
+            self._httpServer.serve_forever()
+        finally:
+            self._stopped.set()
+
+    def stop(self):
+        self._stopped.set()
+        self._httpServer.shutdown()
+        self._httpServer.server_close()
+        for thread in self._threads:
+            thread.join(5)
+
+    def _generateEvents(self):
+        # Generate events in small bursts rather than one by one, to keep up
+        # with high rates.
+        interval = 0.1
+        owed = 0.0
+        user = {"type": "HumanUser", "id": 1, "name": "Stand-in user"}
+        while not self._stopped.wait(interval):
+            owed += self.eventRate * interval
+            if owed >= 1:
+                self.store.generateEvents(int(owed), user)
+                owed -= int(owed)
+
+    def call(self, method, params):
+        """
+        Run an RPC call.
+
+        @param method: The name of the method.
+        @type method: I{str}
+        @param params: The authentication parameters, then the parameters of
+            the method if it has any.
+        @type params: I{list}
+
+        @return: The results of the call.
+        """
+        with self._callsLock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+
+        if method == "info":
+            return {
+                "version": SERVER_VERSION,
+                "full_version": SERVER_VERSION + [0],
+                "user_authentication_method": "default",
+            }
+
+        auth = params[0] if params else {}
+        args = params[1] if len(params) > 1 else {}
+        user = {
+            "type": "ApiUser",
+            "id": 1,
+            "name": auth.get("script_name") or auth.get("user_login"),
+        }
+
+        if method == "read":
+            paging = args.get("paging", {})
+            perPage = paging.get("entities_per_page", 500)
+            entities, hasNextPage = self.store.read(
+                args["type"],
+                args.get("filters") or {"logical_operator": "and", "conditions": []},
+                args.get("return_fields") or ["id"],
+                args.get("sorts"),
+                paging.get("current_page", 1),
+                perPage,
+                args.get("return_only") == "retired",
+            )
+            return {
+                "entities": entities,
+                "paging_info": {"has_next_page": hasNextPage},
+            }
+        if method == "create":
+            return [self._create(args, user)]
+        if method == "update":
+            return [self._update(args, user)]
+        if method == "delete":
+            return self.store.delete(args["type"], args["id"], user)
+        if method == "batch":
+            # All or nothing, like the real thing.
+            with self.store._lock:
+                for request in args:
+                    if request["request_type"] in ("update", "delete"):
+                        self.store._get(request["type"], request["id"])
+                results = []
+                for request in args:
+                    if request["request_type"] == "create":
+                        results.append(self._create(request, user))
+                    elif request["request_type"] == "update":
+                        results.append(self._update(request, user))
+                    elif request["request_type"] == "delete":
+                        results.append(
+                            self.store.delete(request["type"], request["id"], user)
+                        )
+                    else:
+                        raise Fault(
+                            "Invalid request_type %s." % request["request_type"]
+                        )
+                return results
+        if method == "schema_field_read":
+            return self.store.readSchema(args["type"], args.get("field_name"))
+
+        raise Fault("Method %s is not supported by the stand-in server." % method)
+
+    def _create(self, args, user):
+        data = dict((f["field_name"], f["value"]) for f in args["fields"])
+        return self.store.create(
+            args["type"], data, args.get("return_fields"), user=user
+        )
+
+    def _update(self, args, user):
+        data = {}
+        modes = {}
+        for field in args["fields"]:
+            data[field["field_name"]] = field["value"]
+            if "multi_entity_update_mode" in field:
+                modes[field["field_name"]] = field["multi_entity_update_mode"]
+        return self.store.update(args["type"], args["id"], data, modes, user)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # Keep connections open between calls, as the client expects.
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        standIn = self.server.standIn
+        body = self.rfile.read(int(self.headers.get("content-length", 0)))
+
+        if standIn.latency:
+            time.sleep(standIn.latency * random.uniform(0.5, 1.5) / 1000.0)
+
+        if self.path != API_PATH:
+            self._send(404, {"message": "Unknown path %s." % self.path})
+            return
+        if standIn.errorRate and random.random() < standIn.errorRate:
+            self._send(standIn.errorStatus, {"message": "Injected error."})
+            return
+
+        try:
+            payload = json.loads(body.decode("utf-8"))
+            results = standIn.call(payload["method_name"], payload.get("params", []))
+        except Fault as err:
+            self._send(200, {"exception": True, "message": str(err)})
+        except Exception as err:
+            self._send(
+                200,
+                {"exception": True, "message": "%s: %s" % (type(err).__name__, err)},
+            )
+        else:
+            self._send(200, {"results": results})
+
+    def _send(self, status, data):
+        body = json.dumps(data, default=_encode).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _now():
+    return datetime.datetime.utcnow().replace(microsecond=0)
+
+
+def _encode(value):
+    if isinstance(value, datetime.datetime):
+        return value.strftime(DATE_TIME_FORMAT)
+    raise TypeError("Can't encode %r." % (value,))
+
+
+def _link(record):
+    return {
+        "type": record["type"],
+        "id": record["id"],
+        "name": record.get("code") or record.get("name") or record.get("content"),
+    }
+
+
+def _dataType(value):
+    if isinstance(value, bool):
+        return "checkbox"
+    if isinstance(value, int):
+        return "number"
+    if isinstance(value, float):
+        return "float"
+    if isinstance(value, datetime.datetime):
+        return "date_time"
+    if isinstance(value, dict):
+        return "entity"
+    if isinstance(value, list):
+        return "multi_entity"
+    return "text"
+
+
+def _comparable(value):
+    # Entities compare by type and id, dates as the strings clients send.
+    if isinstance(value, dict) and "type" in value and "id" in value:
+        return (value["type"], value["id"])
+    if isinstance(value, datetime.datetime):
+        return value.strftime(DATE_TIME_FORMAT)
+    return value
+
+
+def _sortKey(value):
+    value = _comparable(value)
+    return (value is not None, value if value is not None else 0)
+
+
+def _matches(record, filters):
+    if "conditions" in filters:
+        results = (_matches(record, c) for c in filters["conditions"])
+        if filters.get("logical_operator") == "or":
+            return any(results)
+        return all(results)
+
+    value = _comparable(record.get(filters["path"]))
+    relation = filters["relation"]
+    values = [_comparable(v) for v in filters.get("values", [])]
+
+    if relation == "is":
+        return value == values[0]
+    if relation == "is_not":
+        return value != values[0]
+    if relation == "in":
+        return value in values
+    if relation == "not_in":
+        return value not in values
+    if value is None:
+        return False
+    if relation == "greater_than":
+        return value > values[0]
+    if relation == "less_than":
+        return value < values[0]
+    if relation == "between":
+        return values[0] <= value <= values[1]
+    if relation == "contains":
+        return values[0] in value
+    if relation == "starts_with":
+        return value.startswith(values[0])
+    if relation == "type_is":
+        return value[0] == values[0]
+    raise Fault("Relation %s is not supported by the stand-in server." % relation)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Serve a stand-in Flow Production Tracking site from memory."
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument(
+        "--entities", type=int, default=100, help="Shots, versions and tasks."
+    )
+    parser.add_argument(
+        "--events", type=int, default=0, help="Events in the log on startup."
+    )
+    parser.add_argument(
+        "--event-rate",
+        dest="eventRate",
+        type=float,
+        default=0,
+        help="New events every second.",
+    )
+    parser.add_argument(
+        "--latency", type=float, default=0, help="Milliseconds added to every call."
+    )
+    parser.add_argument(
+        "--error-rate",
+        dest="errorRate",
+        type=float,
+        default=0.0,
+        help="Fraction of calls failing with --error-status.",
+    )
+    parser.add_argument("--error-status", dest="errorStatus", type=int, default=503)
+    options = parser.parse_args()
+
+    store = StandInStore()
+    store.seed(options.entities)
+    store.generateEvents(options.events)
+
+    server = StandInServer(
+        options.host,
+        options.port,
+        store,
+        options.latency,
+        options.errorRate,
+        options.errorStatus,
+        options.eventRate,
+    )
+    print("Serving a stand-in site on %s" % server.url)
+    try:
+        server.serveForever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())